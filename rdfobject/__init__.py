@@ -1,4 +1,5 @@
-from rdfobject import RDFobject, URINotSetException, N3NotUnderstoodException, TextInputSource
+from rdfobject import RDFobject, CompactRDFobject, LazyRDFobject, URINotSetException, N3NotUnderstoodException, TextInputSource
+from termtable import TermTable
 from urihelper import URIHelper, NotANamespaceException, PrefixNotKnownException, NAMESPACES
 from fileentity import FileEntityFactory, FileMultiEntityFactory
 from fedoraobjentity import FedoraEntityFactory
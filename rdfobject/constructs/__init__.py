@@ -1,4 +1,4 @@
-from manifest import Manifest, ItemAlreadyExistsException, ItemDoesntExistException
+from manifest import Manifest, LazyManifest, ItemAlreadyExistsException, ItemDoesntExistException
 
 from entity import Entity, NamedGraphNotFoundException
 
@@ -2,12 +2,28 @@
 # -*- coding: utf-8 -*-
 from rdfobject import *
 from rdfobject.constructs import Manifest
+from rdfobject.streamwriter import get_writer
+
+from rdflib import URIRef, Literal
+
+try:
+    from rdflib.Graph import ReadOnlyGraphAggregate
+except ImportError:
+    from rdflib.graph import ReadOnlyGraphAggregate
 
 from datetime import datetime
 
 class NamedGraphNotFoundException(Exception):
     pass
 
+class EntityGraph(ReadOnlyGraphAggregate):
+    """Read-only view of several graphs as one, without copying their
+    triples, which serialises with the given prefix bindings"""
+    def __init__(self, graphs, bindings):
+        ReadOnlyGraphAggregate.__init__(self, graphs)
+        for prefix, ns in bindings.iteritems():
+            self.namespace_manager.bind(prefix, ns)
+
 class Entity(object):
     def __init__(self, uri=None, manifest_uri=None):
         self._reset(uri, manifest_uri)
@@ -22,7 +38,10 @@ class Entity(object):
             self.uri = self.root.uri
         if manifest_uri:
             self.root.add_triple("dcterms:requires", manifest_uri)
-        self.manifest = Manifest(manifest_uri)
+        # indexed, so isPartOf and the like are looked up rather than scanned for
+        self.manifest = Manifest(manifest_uri, indexed=True)
+        self._aggregates = (None, None, [])
+        self._root_graph = (None, None, None)
         
     def add_namespaces(self, ns_dict):
         """Convenience method for adding namespaces"""
@@ -54,39 +73,140 @@ class Entity(object):
         else:
             self.manifest.del_triple(s,p,o)
 
+    def _split_triples(self, triples):
+        """Separate (s, p, o) into root (p, o) pairs and manifest triples"""
+        root, manifest = [], []
+        resolved = {}
+        for s, p, o in triples:
+            if s not in resolved:
+                resolved[s] = self.uh.parse_uri(s)
+            s = resolved[s]
+            if s == self.uri:
+                root.append((p, o))
+            else:
+                manifest.append((s, p, o))
+        return root, manifest
+
+    def add_triples(self, triples, create_item=True):
+        root, manifest = self._split_triples(triples)
+        if root:
+            self.root.add_triples(root)
+        if manifest:
+            self.manifest.add_triples(manifest, create_item)
+
+    def del_triples(self, triples):
+        root, manifest = self._split_triples(triples)
+        if root:
+            self.root.del_triples(root)
+        if manifest:
+            self.manifest.del_triples(manifest)
+
     def add_type(self, uritype):
         self.root.add_type(uritype)
 
     def del_type(self, uritype):
         self.root.del_type(uritype)
 
-    def list_aggregates(self):
-        g = self.root.get_graph()
-        agg = []
-        for _,_,o in g.triples((None, self.uh.parse_uri("ore:aggregates"), None)):
-            agg.append(o)
-        return agg
+    def _page(self, values, offset, limit):
+        if limit is None:
+            return values[offset:]
+        return values[offset:offset+limit]
+
+    def _sorted_aggregates(self):
+        # kept until the root changes - or is replaced, as on a reload
+        root, revision, aggregates = self._aggregates
+        if root is not self.root or revision != self.root.revision:
+            aggregates = sorted(self.root.list_objects("ore:aggregates"))
+            self._aggregates = (self.root, self.root.revision, aggregates)
+        return aggregates
+
+    def list_aggregates(self, offset=0, limit=None):
+        """The ore:aggregates of the root, in order, optionally a page at a time"""
+        return self._page(self._sorted_aggregates(), offset, limit)
+
+    def count_aggregates(self):
+        return len(self._sorted_aggregates())
+
+    def list_parts_of(self, uri=None, offset=0, limit=None):
+        """The items that are dcterms:isPartOf uri (this entity, by default), in order"""
+        uri = self.uh.parse_uri(uri or self.uri)
+        parts = sorted([s for s,_,_ in self.manifest.triples((None, "dcterms:isPartOf", uri))])
+        return self._page(parts, offset, limit)
+
+    def count_parts_of(self, uri=None):
+        uri = self.uh.parse_uri(uri or self.uri)
+        return len(list(self.manifest.triples((None, "dcterms:isPartOf", uri))))
+
+    def list_versions(self, part_uri, offset=0, limit=None):
+        """The dcterms:hasVersion of a part, in order"""
+        return self._page(sorted(self.manifest.list_objects(part_uri, "dcterms:hasVersion")), offset, limit)
+
+    def count_versions(self, part_uri):
+        return len(self.manifest.list_objects(part_uri, "dcterms:hasVersion"))
+
+    def triples(self, (s, p, o)):
+        """Generator of the (s, p, o) in the root and manifest matching the
+        pattern, None matching anything, without building a graph"""
+        if s is not None:
+            s = self.uh.parse_uri(s)
+        if s is None or s == self.root.uri:
+            if p is not None:
+                p = self.uh.parse_uri(p)
+            if o is not None and not isinstance(o, URIRef) and not isinstance(o, Literal):
+                o = self.uh.parse_uri(o, return_Literal_not_Exception=True)
+            for p_uri, o_uri in self.root.match(p, o):
+                yield (self.root.uri, p_uri, o_uri)
+        if s != self.root.uri:
+            for triple in self.manifest.triples((s, p, o)):
+                yield triple
 
     def __str__(self, format="xml"):
         return self.to_string(format)
 
-    def get_graph(self):
-        g = self.root.get_graph()
-        g_m = self.manifest.get_graph()
-        if g_m:
-            for prefix, ns in g_m.namespaces():
-                g.bind(prefix, ns)
-            for s,p,o in g_m.triples((None, None, None)):
-                g.add((s, p, o))
+    def _get_root_graph(self):
+        # rebuilt only when the root changes - or is replaced, as on a reload
+        root, state, g = self._root_graph
+        if root is not self.root or state != (self.root.revision, self.uh.generation):
+            g = self.root.get_graph()
+            self._root_graph = (self.root, (self.root.revision, self.uh.generation), g)
         return g
+
+    def get_graph(self, include_parts=False):
+        """The root and manifest (and with include_parts, the named graphs) as
+        one read-only graph. The triples aren't copied - it is a view over
+        graphs that are only rebuilt when they change."""
+        graphs = [self._get_root_graph()]
+        bindings = self.manifest.get_bindings()
+        bindings.update(self.root.get_bindings())
+        parts = [self.manifest]
+        if include_parts:
+            parts.extend([self.parts_objs[uri] for uri in sorted(self.parts_objs)])
+        for part in parts:
+            g = part.get_graph()
+            if g:
+                graphs.append(g)
+        return EntityGraph(graphs, bindings)
     
     def to_string(self, format="xml"):
         return self.get_graph().serialize(format=format, encoding="utf-8") + u"\n"
 
+    def to_stream(self, out, format="nt"):
+        """Write the root and manifest to a file-like object. N-Triples and
+        Turtle are written without building a graph; any other format goes
+        through to_string."""
+        bindings = self.manifest.get_bindings()
+        bindings.update(self.root.get_bindings())
+        w = get_writer(format, out, bindings)
+        if w is None:
+            out.write(self.to_string(format))
+            return
+        w.subject(self.root.uri, self.root.list_statements())
+        self.manifest.write_items(w)
+
     def from_string(self, root_uri, rdfstring, format="xml"):
         t = TextInputSource(rdfstring)
         g = ConjunctiveGraph()
-        g = g.parse(t, format)
+        g = g.parse(t, format=format)
         for prefix, ns in g.namespaces():
             self.add_namespace(prefix ,ns)
         for s,p,o in g.triples((None, None, None)):
@@ -125,7 +245,7 @@ class Entity(object):
 
     def del_named_graph(self, graph_id):
         uri = self.uh.parse_uri("%s/%s" % (self.uri, graph_id))
-        if uri in parts:
+        if uri in self.parts:
             self.parts.remove(uri)
             del self.parts_objs[uri]
             self.del_triple(self.uri, "ore:aggregates", uri)
@@ -3,8 +3,17 @@
 
 from rdfobject import *
 
+from rdfobject.rdfobject import DEFAULT_NAMESPACES, DIGEST_MODULUS, SharedNamespaces, same_format
+from rdfobject.streamwriter import get_writer
+from rdfobject.streamparser import SubjectSink, parse_stream, STREAM_PARSE_FORMATS
+
 import rdflib
-from rdflib import ConjunctiveGraph
+from rdflib import ConjunctiveGraph, URIRef, Literal
+
+from collections import OrderedDict
+
+# statements a streaming from_string collects before adding them to the items
+STREAM_BATCH_SIZE = 10000
 
 class ItemAlreadyExistsException(Exception):
     """The Item already is listed in the manifest"""
@@ -20,67 +29,147 @@ def _altered_flag(fn):
         return fn(self, *args, **kw)
     return new
 
-
 class Manifest(object):
-    def __init__(self, uri=None):
-        self.items = []
-        self.items_rdfobjects = {}
-        self.namespaces = {}
+    def __init__(self, uri=None, compact=False, indexed=False):
+        """Items all use this manifest's namespace table rather than each
+        keeping a copy, so adding or removing a namespace doesn't touch them.
+
+        compact=True holds items as CompactRDFobjects: slotted, and interning
+        their terms in a TermTable belonging to this manifest.
+
+        indexed=True keeps predicate -> (s, o) and object -> (s, p) indexes
+        across the items for list_by_predicate/list_by_object, brought up to
+        date from the journal when they are used. Without them those calls
+        scan every item.
+
+        The graph get_graph() hands back is kept between calls and brought up
+        to date from the journal in the same way."""
+        # item uri -> RDFobject, in the order the items were added
+        self.items_rdfobjects = OrderedDict()
+        self.namespaces = SharedNamespaces()
         self.altered = False
         self._output = False
+        self.compact = compact
+        self.terms = TermTable()
+        # (op, s, p, o) changes since the last checkpoint, shared with the items
+        self.journal = []
+        # predicate -> functions told of each change to it, and the functions
+        # told when changes were lost - see watch()
+        self._watchers = {}
+        self._watchers_lost = []
+        self.indexed = indexed
+        self._by_predicate = None
+        self._by_object = None
+        self._graph = None
+        self._graph_bindings = None
+        # how much of the journal the indexes and graph have seen, and its last entry
+        self._seen = 0
+        self._seen_last = None
         self.uh = URIHelper()
+        for prefix, ns in DEFAULT_NAMESPACES:
+            self.add_namespace(prefix, ns)
         if uri:
             self.uri = self.uh.parse_uri(uri)
 
+    def _new_item(self, uri):
+        if self.compact:
+            r = CompactRDFobject(uri, self.namespaces, self.uh, self.terms)
+        else:
+            r = RDFobject(uri)
+            r.namespaces = self.namespaces
+        r.journal = self.journal
+        return r
+
+    def checkpoint(self):
+        """Hand back the journal of changes made to any item since the last
+        checkpoint, oldest first, and start a new one"""
+        self._sync_views()
+        journal = list(self.journal)
+        del self.journal[:]
+        self._seen = 0
+        self._seen_last = None
+        return journal
+
+    def _forget_journal(self, start):
+        """Drop the journal entries from start on, once the indexes and graph
+        have taken them in"""
+        self._sync_views()
+        del self.journal[start:]
+        self._seen = len(self.journal)
+        self._seen_last = self.journal and self.journal[-1] or None
+
+    def watch(self, predicates, changed, lost):
+        """Call changed(op, s, p, o) for each journalled change to a statement
+        with one of predicates, as the indexes take it in - on sync() or
+        checkpoint() at the latest - and lost() if the journal was emptied
+        before they could, so that the watcher should start again"""
+        for p in predicates:
+            self._watchers.setdefault(self.uh.parse_uri(p), []).append(changed)
+        self._watchers_lost.append(lost)
+
+    def sync(self):
+        """Bring the indexes, graph and watchers up to date with the journal"""
+        self._sync_views()
+
+    @property
+    def items(self):
+        """The item URIs, in order, as a tuple. Building it is O(n) in the
+        number of items, so take it once rather than on every step of a loop.
+        It can't be sorted or otherwise changed - to put the items in another
+        order, use reorder()."""
+        return tuple(self.items_rdfobjects)
+
+    def reorder(self, uris):
+        """Put the items in the order of uris, which must list each of them"""
+        self.items_rdfobjects = OrderedDict([(uri, self.items_rdfobjects[uri]) for uri in uris])
+
     def __iter__(self):
-        class Manifest_iter:
-            def __init__(self, items, items_dict):
-                self.items = items
-                self.items_dict = items_dict
-                self.last = 0
-            def __iter__(self):
-                return self
-            def next(self):
-                if self.last >= len(self.items):         # threshhold terminator
-                    raise StopIteration
-                elif len(self.items) == 0:
-                    raise StopIteration
-                else:
-                    self.last += 1
-                    return self.items_dict[self.items[self.last-1]]
-        return Manifest_iter(self.items, self.items_rdfobjects)
+        # over a copy, so items can be added or removed along the way
+        return iter(self.items_rdfobjects.values())
 
     # @_altered_flag
     def add_namespace(self, prefix, ns):
         self.namespaces[prefix] = self.uh.get_namespace(ns)
         if prefix not in self.uh.namespaces:
-            self.uh.namespaces[prefix] = self.uh.get_namespace(ns)
-        for item in self.items_rdfobjects:
-            self.items_rdfobjects[item].add_namespace(prefix, ns)
+            self.uh.add_namespace(prefix, self.uh.get_namespace(ns), replace=False)
 
     # @_altered_flag
     def del_namespace(self, prefix):
         if prefix in self.namespaces:
             del self.namespaces[prefix]
-            for item in self.items_rdfobjects:
-                self.items_rdfobjects[item].del_namespace(prefix)
 
     @_altered_flag
-    def from_string(self, rdf_manifest_string, format="xml"):
+    def from_string(self, rdf_manifest_string, format="xml", streaming=False):
+        """Add the statements in rdf_manifest_string to the items. With
+        streaming=True, N-Triples and RDF/XML go straight to the items in
+        batches as they are read, rather than into a graph first, so only
+        one copy of the data is held. As with RDFobject.from_string, what is
+        loaded isn't journalled as a change - though any changes made before
+        it still are."""
+        start = len(self.journal)
+        if streaming and format in STREAM_PARSE_FORMATS:
+            batch = []
+            def add(s, p, o):
+                batch.append((s, p, o))
+                if len(batch) >= STREAM_BATCH_SIZE:
+                    self.add_triples(batch)
+                    del batch[:]
+            sink = SubjectSink(None, add)
+            parse_stream(rdf_manifest_string, format, sink)
+            self.add_triples(batch)
+            for prefix, ns in sink.namespaces.items():
+                self.add_namespace(prefix, ns)
+            self._forget_journal(start)
+            return
         t = TextInputSource(rdf_manifest_string)
         g = ConjunctiveGraph()
-        g = g.parse(t, format)
+        g = g.parse(t, format=format)
         
-        for s,p,o in g.triples((None, None, None)):
-            if s not in self.items:
-                self.items.append(s)
-            if p == NAMESPACES['rdf']['type']:
-                self.items_rdfobjects.setdefault(s,RDFobject(uri=s)).add_type(o)
-            else:
-                self.items_rdfobjects.setdefault(s,RDFobject(uri=s)).add_triple(p, o)
+        self.add_triples(g.triples((None, None, None)))
 
         for prefix, ns in g.namespaces():
             self.add_namespace(prefix ,ns)
+        self._forget_journal(start)
     
     def to_string(self, format="xml"):
         if self.altered == False and isinstance(self._output, rdflib.ConjunctiveGraph):
@@ -92,28 +181,84 @@ class Manifest(object):
         else:
             return u'<?xml version="1.0" encoding="UTF-8"?>\n'
     
+    def to_stream(self, out, format="nt"):
+        """Write to a file-like object. N-Triples and Turtle are written item
+        by item without building a graph; any other format goes through to_string."""
+        w = get_writer(format, out, self.get_bindings())
+        if w is None:
+            out.write(self.to_string(format))
+            return
+        self.write_items(w)
+        # as with to_string, the manifest counts as written out now - drop
+        # any cached graph so to_string doesn't hand back a stale copy
+        self._output = False
+        self.altered = False
+
+    def write_items(self, w):
+        for item, r in self.items_rdfobjects.iteritems():
+            w.subject(item, r.list_statements())
+            r.altered = False
+
+    def digest(self, item_uris=None):
+        """Digest of every item's triples - or just those of item_uris - see
+        RDFobject.digest"""
+        if item_uris is None:
+            items = self.items_rdfobjects.itervalues()
+        else:
+            items = [self.items_rdfobjects[uri] for uri in item_uris]
+        total = 0
+        for item in items:
+            total += item._digest_sum()
+        return '%032x' % (total % DIGEST_MODULUS)
+
+    def select(self, item_uris):
+        """A Manifest of just the given items, for writing out part of this
+        one. It holds the same RDFobjects, not copies, so is not for changing."""
+        m = Manifest(getattr(self, 'uri', None), self.compact)
+        m.namespaces = self.namespaces
+        m.terms = self.terms
+        for uri in item_uris:
+            m.items_rdfobjects[uri] = self.items_rdfobjects[uri]
+        return m
+
+    def get_bindings(self):
+        """prefix -> namespace map used for output"""
+        bindings = {}
+        if self.items_rdfobjects:
+            bindings.update(self._first_item().namespaces)
+        bindings.update(self.uh.namespaces)
+        bindings.update(self.namespaces)
+        return bindings
+
     def get_graph(self):
-        if self.items and self.items_rdfobjects:
-            g = ConjunctiveGraph()
-            # add bindings from the first graph:
-            ns_list = self.items_rdfobjects[self.items[0]].namespaces
-            for prefix in ns_list:
-                g.bind(prefix, ns_list[prefix])
-            #add global prefix bindings
-            for ns in self.uh.namespaces:
-                g.bind(ns, self.uh.namespaces[ns])
-            
-            for item in self.items_rdfobjects:
-                for s,p,o in self.items_rdfobjects[item].list_triples():
-                    g.add((s,p,o))
-                self.items_rdfobjects[item].altered = False
-            return g
+        """The items as a ConjunctiveGraph, or "" if there are none. The same
+        graph is handed back each time, kept up to date as the items change,
+        so treat it as read-only."""
+        if self.items_rdfobjects:
+            # bindings from the first graph, then the global prefix bindings
+            bindings = dict(self._first_item().namespaces)
+            bindings.update(self.uh.namespaces)
+            self._sync_views()
+            if self._graph is None or bindings != self._graph_bindings:
+                g = ConjunctiveGraph()
+                for prefix in bindings:
+                    g.bind(prefix, bindings[prefix])
+                for item in self.items_rdfobjects:
+                    for s,p,o in self.items_rdfobjects[item].list_triples():
+                        g.add((s,p,o))
+                    self.items_rdfobjects[item].altered = False
+                self._graph = g
+                self._graph_bindings = bindings
+            return self._graph
         else:
             return ""
     
+    def _first_item(self):
+        return self.items_rdfobjects[next(iter(self.items_rdfobjects))]
+
     def get_item(self, item_uri):
         r_uri = self.uh.parse_uri(item_uri)
-        if r_uri not in self.items:
+        if r_uri not in self.items_rdfobjects:
             raise ItemDoesntExistException()
         else:
             return self.items_rdfobjects[r_uri]
@@ -121,33 +266,65 @@ class Manifest(object):
     @_altered_flag
     def add_item(self, item_uri):
         r_uri = self.uh.parse_uri(item_uri)
-        if r_uri not in self.items:
-            self.items_rdfobjects[r_uri] = RDFobject(item_uri)
-            self.items.append(r_uri)
-            for prefix in self.namespaces:
-                self.items_rdfobjects[r_uri].add_namespace(prefix, self.namespaces[prefix])
+        if r_uri not in self.items_rdfobjects:
+            self.items_rdfobjects[r_uri] = self._new_item(r_uri)
         else:
             raise ItemAlreadyExistsException()
 
     @_altered_flag    
     def del_item(self, item_uri):
         r_uri = self.uh.parse_uri(item_uri)
-        if r_uri in self.items:
-            del self.items_rdfobjects[r_uri]
-            self.items.remove(r_uri)
+        if r_uri in self.items_rdfobjects:
+            item = self.items_rdfobjects.pop(r_uri)
+            item._journal('del', item.list_statements())
         else:
             raise ItemDoesntExistException()
 
     @_altered_flag
     def add_triple(self, s, p, o, create_item=True):
         s = self.uh.parse_uri(s)
-        if s not in self.items:
+        if s not in self.items_rdfobjects:
             if create_item:
                 self.add_item(s)
             else:
                 raise ItemDoesntExistException()
         self.items_rdfobjects[s].add_triple(p,o)
 
+    def _group_by_item(self, triples, create_item):
+        """{item uri: [(p, o), ...]} for an iterable of (s, p, o), resolving
+        each distinct subject once"""
+        grouped = {}
+        resolved = {}
+        for s, p, o in triples:
+            try:
+                s_uri = resolved[s]
+            except KeyError:
+                s_uri = resolved[s] = self.uh.parse_uri(s)
+                if s_uri not in self.items_rdfobjects:
+                    if create_item:
+                        self.add_item(s_uri)
+                    else:
+                        raise ItemDoesntExistException()
+            grouped.setdefault(s_uri, []).append((p, o))
+        return grouped
+
+    @_altered_flag
+    def add_triples(self, triples, create_item=True):
+        """Add an iterable of (s, p, o) in one go, with one add_triples call per item"""
+        triples = list(triples)
+        # resolve every object in the batch together, rather than item by item
+        objects = self.uh.parse_many([o for s, p, o in triples])
+        triples = [(s, p, o) for (s, p, _), o in zip(triples, objects)]
+        for s_uri, statements in self._group_by_item(triples, create_item).iteritems():
+            self.items_rdfobjects[s_uri].add_triples(statements)
+
+    @_altered_flag
+    def del_triples(self, triples):
+        """Remove an iterable of (s, p, o) in one go - an o of None removes every
+        value of p for that item, as in del_triple"""
+        for s_uri, statements in self._group_by_item(triples, False).iteritems():
+            self.items_rdfobjects[s_uri].del_triples(statements)
+
     def triple_exists(self, s, p, o):
         if s and s != "*":
             s_uri = self.uh.parse_uri(s)
@@ -155,8 +332,112 @@ class Manifest(object):
                 return self.items_rdfobjects[s_uri].triple_exists(p,o)
         return False
 
+    def _sync_views(self):
+        """Apply the journal entries the indexes and graph haven't seen yet"""
+        journal = self.journal
+        if len(journal) < self._seen or \
+           (self._seen and journal[self._seen-1] is not self._seen_last):
+            # the journal was emptied other than by checkpoint() - rebuild
+            # from the items when next needed
+            self._by_predicate = self._by_object = self._graph = None
+            for lost in self._watchers_lost:
+                lost()
+        else:
+            by_predicate, by_object, g = self._by_predicate, self._by_object, self._graph
+            watchers = self._watchers
+            for i in xrange(self._seen, len(journal)):
+                op, s, p, o = journal[i]
+                if p in watchers:
+                    for changed in watchers[p]:
+                        changed(op, s, p, o)
+                if op == 'add':
+                    if by_predicate is not None:
+                        by_predicate.setdefault(p, set([])).add((s, o))
+                        by_object.setdefault(o, set([])).add((s, p))
+                    if g is not None:
+                        g.add((s, p, o))
+                else:
+                    if by_predicate is not None:
+                        for index, key, entry in ((by_predicate, p, (s, o)), (by_object, o, (s, p))):
+                            entries = index.get(key)
+                            if entries:
+                                entries.discard(entry)
+                                if not entries:
+                                    del index[key]
+                    if g is not None:
+                        g.remove((s, p, o))
+        self._seen = len(journal)
+        self._seen_last = journal and journal[-1] or None
+
+    def _sync_indexes(self):
+        self._sync_views()
+        if self._by_predicate is None:
+            self._by_predicate = {}
+            self._by_object = {}
+            for s, item in self.items_rdfobjects.iteritems():
+                for p, o in item.list_statements():
+                    self._by_predicate.setdefault(p, set([])).add((s, o))
+                    self._by_object.setdefault(o, set([])).add((s, p))
+
+    def list_by_predicate(self, p):
+        """(s, o) for every item statement with predicate p"""
+        p_uri = self.uh.parse_uri(p)
+        if self.indexed:
+            self._sync_indexes()
+            return list(self._by_predicate.get(p_uri, ()))
+        pairs = []
+        for s_uri, item in self.items_rdfobjects.iteritems():
+            pairs.extend([(s_uri, o) for o in item.list_objects(p_uri)])
+        return pairs
+
+    def list_by_object(self, o):
+        """(s, p) for every item statement with object o"""
+        if not isinstance(o, URIRef) and not isinstance(o, Literal):
+            o = self.uh.parse_uri(o, return_Literal_not_Exception=True)
+        if self.indexed:
+            self._sync_indexes()
+            return list(self._by_object.get(o, ()))
+        pairs = []
+        for s_uri, item in self.items_rdfobjects.iteritems():
+            pairs.extend([(s_uri, p) for p, obj in item.list_statements() if obj == o])
+        return pairs
+
+    def triples(self, (s, p, o)):
+        """Generator of the (s, p, o) across all items matching the pattern,
+        None matching anything, as with rdflib's Graph.triples but without
+        building a graph. Don't change the manifest while consuming it."""
+        if s is not None:
+            s = self.uh.parse_uri(s)
+        if p is not None:
+            p = self.uh.parse_uri(p)
+        if o is not None and not isinstance(o, URIRef) and not isinstance(o, Literal):
+            o = self.uh.parse_uri(o, return_Literal_not_Exception=True)
+        if s is not None:
+            item = self.items_rdfobjects.get(s)
+            if item is not None:
+                for p_uri, o_uri in item.match(p, o):
+                    yield (s, p_uri, o_uri)
+        elif self.indexed and (p is not None or o is not None):
+            self._sync_indexes()
+            if p is not None:
+                for s_uri, o_uri in self._by_predicate.get(p, ()):
+                    if o is None or o_uri == o:
+                        yield (s_uri, p, o_uri)
+            else:
+                for s_uri, p_uri in self._by_object.get(o, ()):
+                    yield (s_uri, p_uri, o)
+        else:
+            for s_uri, item in self.items_rdfobjects.iteritems():
+                for p_uri, o_uri in item.match(p, o):
+                    yield (s_uri, p_uri, o_uri)
+
     def list_objects(self, s, p):
         if s == "*":
+            if self.indexed:
+                construct = {}
+                for s_uri, o in self.list_by_predicate(p):
+                    construct.setdefault(s_uri, []).append(o)
+                return construct
             construct = {}
             for s_uri in self.items_rdfobjects.keys():
                 objs = self.items_rdfobjects[s_uri].list_objects(p)
@@ -172,8 +453,105 @@ class Manifest(object):
     def del_triple(self, s, p, o=None):
         """ NB To delete all of a certain property (p) in a given item (s), do not set (o)"""
         s = self.uh.parse_uri(s)
-        if s in self.items:
+        if s in self.items_rdfobjects:
             self.items_rdfobjects[s].del_triple(p,o)
         else:
             raise ItemDoesntExistException()
     
+
+class LazyManifest(Manifest):
+    """A Manifest read from storage, holding the stored bytes (with the
+    version and checksum they were stored under) and only parsing them when
+    its items are first needed. Until it is changed, to_string and to_stream
+    in the format it was stored in hand back those bytes as they are.
+
+    raw may also be a list of the stored shards of a manifest, each parsed in
+    turn, in which case there are no bytes to hand back."""
+    def __init__(self, uri, raw, format="xml", version=None, checksum=None, compact=False, indexed=False):
+        # stored_digest is the digest() of what was read, once it is parsed
+        self.loaded = False
+        self.raw = raw
+        self.format = format
+        self.version = version
+        self.checksum = checksum
+        self.compact = compact
+        self.indexed = indexed
+        self.altered = False
+        self._output = False
+        self.pristine = True
+        self.stored_digest = None
+        self._on_load = []
+        self.uh = URIHelper()
+        if uri:
+            self.uri = self.uh.parse_uri(uri)
+
+    def __getattr__(self, name):
+        # only reached for attributes that aren't set - before parsing, that
+        # is the items, namespaces and journal
+        if name.startswith('__') or self.__dict__.get('loaded', True):
+            raise AttributeError(name)
+        self.load()
+        return getattr(self, name)
+
+    def when_loaded(self, fn):
+        """Call fn(manifest) once it has been parsed (now, if it has been)"""
+        if self.loaded:
+            fn(self)
+        else:
+            self._on_load.append(fn)
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        # a mutator may have flagged the change that caused the load
+        altered, output = self.altered, self._output
+        Manifest.__init__(self, self.__dict__.get('uri'), self.compact, self.indexed)
+        if isinstance(self.raw, list):
+            shards = self.raw
+        else:
+            shards = [self.raw]
+        for text in shards:
+            if self.format != "xml" and not isinstance(text, unicode):
+                text = text.decode('utf-8')
+            self.from_string(text, format=self.format, streaming=True)
+        # reading it in isn't a change
+        del self.journal[:]
+        self.pristine = True
+        self.stored_digest = self.digest()
+        self.altered, self._output = altered, output
+        on_load, self._on_load = self._on_load, []
+        for fn in on_load:
+            fn(self)
+
+    def checkpoint(self):
+        if not self.loaded:
+            return []
+        journal = Manifest.checkpoint(self)
+        if journal:
+            self.pristine = False
+        return journal
+
+    def add_namespace(self, prefix, ns):
+        Manifest.add_namespace(self, prefix, ns)
+        self.pristine = False
+
+    def del_namespace(self, prefix):
+        Manifest.del_namespace(self, prefix)
+        self.pristine = False
+
+    def is_pristine(self, format):
+        """True if the stored bytes are still this manifest in format"""
+        return same_format(format, self.format) and not isinstance(self.raw, list) and \
+               (not self.loaded or self.pristine and not self.journal)
+
+    def to_string(self, format="xml"):
+        if self.is_pristine(format):
+            return self.raw
+        return Manifest.to_string(self, format)
+
+    def to_stream(self, out, format="nt"):
+        if self.is_pristine(format):
+            out.write(self.raw)
+            return
+        Manifest.to_stream(self, out, format)
@@ -7,6 +7,8 @@ from rdfobject.constructs import NamedGraphNotFoundException
 
 from datetime import datetime
 
+from bisect import bisect_right
+
 TOPLEVEL_AIISO_ORGS = [u'Center',
                        u'College',
                        u'Department',
@@ -19,9 +21,73 @@ TOPLEVEL_AIISO_ORGS = [u'Center',
                        u'Organisation'
                        ]
 
+class IntervalIndex(object):
+    """key -> (start, end) date intervals, end None for open-ended, answering
+    which keys' intervals contain a date or overlap a range. Queries work on
+    the intervals in start order with a tree of the latest end under each
+    node, so they take logarithmic time plus the number found. It is rebuilt
+    on the first query after a change."""
+    def __init__(self):
+        self.intervals = {}
+        self._starts = None
+
+    def add(self, key, start, end=None):
+        self.intervals[key] = (start, end or datetime.max)
+        self._starts = None
+
+    def remove(self, key):
+        if key in self.intervals:
+            del self.intervals[key]
+            self._starts = None
+
+    def get(self, key):
+        return self.intervals.get(key)
+
+    def _build(self):
+        self._ordered = sorted([(start, end, key) for key, (start, end) in self.intervals.iteritems()])
+        self._starts = [start for start, end, key in self._ordered]
+        size = 1
+        while size < len(self._ordered):
+            size *= 2
+        tree = [datetime.min] * (2 * size)
+        for i, (start, end, key) in enumerate(self._ordered):
+            tree[size + i] = end
+        for i in xrange(size - 1, 0, -1):
+            tree[i] = max(tree[2*i], tree[2*i+1])
+        self._tree, self._size = tree, size
+
+    def overlapping(self, start, end=None):
+        """Keys whose interval overlaps start..end (or contains start, if
+        end is None)"""
+        if end is None:
+            end = start
+        if self._starts is None:
+            self._build()
+        # only intervals starting by end can overlap; of those, look in the
+        # subtrees with one ending at or after start
+        limit = bisect_right(self._starts, end)
+        found = []
+        todo = [(1, 0, self._size)]
+        while todo:
+            node, lo, hi = todo.pop()
+            if lo >= limit or self._tree[node] < start:
+                continue
+            if hi - lo == 1:
+                found.append(self._ordered[lo][2])
+            else:
+                mid = (lo + hi) // 2
+                todo.append((2*node+1, mid, hi))
+                todo.append((2*node, lo, mid))
+        return found
+
 class OrganisationUnit(object):
     def __init__(self, entity):
         self.entity = entity
+        # assertion group uri -> when it is valid, kept up to date by watching
+        # the manifest it was read from
+        self.validity = IntervalIndex()
+        self._watching = None
+        self._validity_stale = True
         self.entity.add_namespace(u'aiiso', u'http://purl.org/vocab/aiiso/schema#')
         self.entity.add_namespace(u'foaf', u'http://xmlns.com/foaf/0.1/')
         self._set_from_entity()
@@ -50,6 +116,53 @@ class OrganisationUnit(object):
         
     def revert(self):
         self.entity.revert()
+        self._validity_stale = True
+        self._validity_index()
+
+    def _watch_validity(self, manifest):
+        """Have manifest tell this unit of changes to validity, which can be
+        made through the entity as well as through this unit"""
+        def changed(op, s, p, o):
+            if manifest is self._watching and not self._validity_stale:
+                self._index_validity(s)
+        def lost():
+            if manifest is self._watching:
+                self._validity_stale = True
+        manifest.watch(("ov:validFrom", "ov:validUntil"), changed, lost)
+        self._watching = manifest
+
+    def _validity_index(self):
+        """The validity index, brought up to date with the manifest's
+        ov:validFrom and ov:validUntil statements, and only read in again
+        in full if the manifest has been replaced"""
+        manifest = self.entity.manifest
+        if manifest is not self._watching:
+            self._watch_validity(manifest)
+            self._validity_stale = True
+        manifest.sync()
+        if self._validity_stale:
+            self.validity = IntervalIndex()
+            # (reading the manifest is what finds the parts, if it was stored)
+            for uri, p, o in list(manifest.triples((None, "ov:validFrom", None))):
+                self._index_validity(uri)
+            self._validity_stale = False
+        return self.validity
+
+    def _index_validity(self, uri):
+        """Index when uri is valid, as recorded in the manifest"""
+        validfrom = None
+        validuntil = None
+        for o in self.entity.manifest.list_objects(uri, "ov:validFrom"):
+            validfrom = self.entity.uh.literal_datetime_to_obj(o)
+
+        for o in self.entity.manifest.list_objects(uri, "ov:validUntil"):
+            validuntil = self.entity.uh.literal_datetime_to_obj(o)
+
+        if validfrom and uri in self.entity.parts:
+            self.validity.add(uri, validfrom, validuntil)
+        else:
+            # never valid without a start, nor if it isn't an assertion group
+            self.validity.remove(uri)
 
     def get_assertion_group(self, id=None, valid_from=datetime.now(), valid_until=None):
         return self.entity.add_named_graph(id, valid_from, valid_until)
@@ -58,41 +171,28 @@ class OrganisationUnit(object):
         """Leave date equal to None to check against the current date."""
         uri = self.entity.uh.parse_uri(uri)
         if uri in self.entity.parts:
-            g = self.entity.manifest.get_graph()
-            validfrom = None
-            validuntil = None
-            for s,p,o in g.triples((uri, 
-                                    self.entity.uh.parse_uri("ov:validFrom"),
-                                    None
-                                    )):
-                validfrom = self.entity.uh.literal_datetime_to_obj(o)
-
-            for s,p,o in g.triples((uri, 
-                                    self.entity.uh.parse_uri("ov:validUntil"),
-                                    None
-                                    )):
-                validuntil = self.entity.uh.literal_datetime_to_obj(o)
-
+            interval = self._validity_index().get(uri)
             if not date:
                 date = datetime.now()
-            
-            if validfrom and date>=validfrom:
-                if not validuntil:
-                    return True
-                else:
-                    if date<=validuntil:
-                        return True
-                    else:
-                        return False
-                
-        
+            return interval is not None and interval[0] <= date <= interval[1]
+        return False
+
+    def list_valid_assertion_groups(self, date=None, until=None):
+        """Assertion groups valid at date (by default, now) - or at any time
+        from date to until, if until is given"""
+        if not date:
+            date = datetime.now()
+        return self._validity_index().overlapping(date, until)
 
     def _set_valid_from(self, assertion_uri, date=datetime.now()):
+        assertion_uri = self.entity.uh.parse_uri(assertion_uri)
         if assertion_uri in self.entity.parts:
-            self.entity.parts_objs[assertion_uri].del_triple("ov:validFrom")
-            self.entity.parts_objs[assertion_uri].add_triple("ov:validFrom", date)
+            # validity is recorded in the entity's manifest, as add_named_graph does
+            self.entity.del_triple(assertion_uri, "ov:validFrom")
+            self.entity.add_triple(assertion_uri, "ov:validFrom", date)
             
     def _set_valid_until(self, assertion_uri, date=datetime.now()):
+        assertion_uri = self.entity.uh.parse_uri(assertion_uri)
         if assertion_uri in self.entity.parts:
-            self.entity.parts_objs[assertion_uri].del_triple("ov:validUntil")
-            self.entity.parts_objs[assertion_uri].add_triple("ov:validUntil", date)
+            self.entity.del_triple(assertion_uri, "ov:validUntil")
+            self.entity.add_triple(assertion_uri, "ov:validUntil", date)
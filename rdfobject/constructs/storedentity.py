@@ -5,11 +5,11 @@ from rdfobject.constructs import Entity
 
 from rdfobject import RDFobject, NAMESPACES
 
-from rdfobject.constructs import Manifest
+from rdfobject.constructs import Manifest, LazyManifest
 
 from rdfobject.stores import ItemDoesntExistException
 
-from rdflib import ConjunctiveGraph
+from rdflib import Literal
 
 from collections import defaultdict
 
@@ -28,12 +28,28 @@ def _init_obj_wrapper(fn):
         return fn(self, *args, **kw)
     return new
 
+def _loaded_manifest_attr(name):
+    # parts and parts_objs are only filled in once a LazyManifest is parsed,
+    # so reading either one parses it first
+    def get(self):
+        manifest = self.__dict__.get('manifest')
+        if isinstance(manifest, LazyManifest):
+            manifest.load()
+        return self.__dict__[name]
+    def set(self, value):
+        self.__dict__[name] = value
+    return property(get, set)
+
 class StoredEntity(Entity):
+    parts = _loaded_manifest_attr('parts')
+    parts_objs = _loaded_manifest_attr('parts_objs')
+
     def init(self, id=None, storageclient=None, **logcontext):
         self.id = id
         self.s = storageclient
         self.obj = None
         self.logcontext = logcontext
+        self.stored_digests = {}
         self.revert()
 
     @_init_obj_wrapper
@@ -44,6 +60,8 @@ class StoredEntity(Entity):
         self.s.log_audit(self.id, self.logcontext, self.context)
         # Change delta logged...
         self.context = defaultdict(list)
+        self.root.checkpoint()
+        self.manifest.checkpoint()
 
     @_init_obj_wrapper
     def add_namespace(self, prefix, ns):
@@ -65,6 +83,18 @@ class StoredEntity(Entity):
         super(StoredEntity, self).del_triple(s,p,o)
         self.context['del'].append((s,p,o.__str__()))
         
+    @_init_obj_wrapper
+    def add_triples(self, triples, create_item=True):
+        triples = list(triples)
+        super(StoredEntity, self).add_triples(triples, create_item=create_item)
+        self.context['add'].extend([(s,p,o.__str__()) for s,p,o in triples])
+
+    @_init_obj_wrapper
+    def del_triples(self, triples):
+        triples = list(triples)
+        super(StoredEntity, self).del_triples(triples)
+        self.context['del'].extend([(s,p,o.__str__()) for s,p,o in triples])
+
     @_init_obj_wrapper
     def add_type(self, uritype):
         super(StoredEntity, self).add_type(uritype)
@@ -116,28 +146,31 @@ class StoredEntity(Entity):
     def revert(self, create_if_nonexistent=True):
         self.load_root(create_if_nonexistent)
         self.load_manifest(create_if_nonexistent)
-        # reset mimetypes for core manifest
-        try:
-            self.manifest.del_triple("%s/%s" % (self.uri, "ROOT"), "dc:format", None)
-        except:
-            pass
-        try:
-            self.manifest.del_triple("%s/%s" % (self.uri, "MANIFEST"), "dc:format", None)
-        except:
-            pass
-        self.manifest.add_triple("%s/%s" % (self.uri, "ROOT"), "dc:format", "application/rdf+xml")
-        self.manifest.add_triple("%s/%s" % (self.uri, "MANIFEST"), "dc:format", "application/rdf+xml")
         self.context = defaultdict(list)
 
+    def _unchanged(self, part_id, rdf):
+        """True if rdf holds the same triples as the last stored version of
+        part_id. Marking something altered and then putting it back - as
+        happens to the manifest's dc:format entries - isn't a change."""
+        stored = self.stored_digests.get(part_id, getattr(rdf, 'stored_digest', None))
+        return stored is not None and rdf.digest() == stored
+
     @_init_obj_wrapper
     def store_root(self):
         # only store the root if it has changed:
         if self.root.altered:
-            return self.obj.putRoot(self.root)
+            if self._unchanged('ROOT', self.root):
+                self.root.altered = False
+                return
+            response = self.obj.putRoot(self.root)
+            self.stored_digests['ROOT'] = self.root.digest()
+            return response
 
     @_init_obj_wrapper
     def load_root(self, create_if_nonexistent=True):
         self.root = self.obj.getRoot()
+        # digests of what this entity has stored since loading
+        self.stored_digests.pop('ROOT', None)
 
     @_init_obj_wrapper
     def put_stream(self, part_id, bytestream, mimetype=None, version=None, commit_metadata_changes=True):
@@ -210,25 +243,54 @@ class StoredEntity(Entity):
     def store_manifest(self):
         # only store the manifest if it has changed:
         if self.manifest.altered:
-            return self.obj.putManifest(self.manifest)
+            if self._unchanged('MANIFEST', self.manifest):
+                self.manifest.altered = False
+                return
+            response = self.obj.putManifest(self.manifest)
+            self.stored_digests['MANIFEST'] = self.manifest.digest()
+            return response
 
     @_init_obj_wrapper
     def load_manifest(self, create_if_nonexistent=True):
         self.manifest = self.obj.getManifest()
-        g = self.manifest.get_graph()
-        if isinstance(g, ConjunctiveGraph):
-            for s,p,o in g.triples(( None, NAMESPACES['foaf']['primaryTopic'], self.root.uri)):
-                if s not in self.parts:
-                    self.parts.add(s)
-                    if s.startswith(self.obj.uri):
-                        part_id = s[len(self.obj.uri)+1:]
-                        r = Manifest(s)
-                        r.from_string(self.obj.get_part(part_id))
-                        self.parts_objs[s] = r
-                    elif s.startswith("http://"):
-                        r = Manifest(s)
-                        r.from_url(s)
-                        self.parts_objs[s] = r
+        # see Entity._reset
+        self.manifest.indexed = True
+        self.stored_digests.pop('MANIFEST', None)
+        if isinstance(self.manifest, LazyManifest):
+            # not parsed until something needs it - nor is the bookkeeping
+            self.manifest.when_loaded(self._manifest_loaded)
+        else:
+            self._manifest_loaded(self.manifest)
+
+    def _manifest_loaded(self, manifest):
+        # what was read in is the baseline for the next commit's journal
+        manifest.checkpoint()
+        for s,p,o in manifest.triples(( None, NAMESPACES['foaf']['primaryTopic'], self.root.uri)):
+            if s not in self.parts:
+                self.parts.add(s)
+                if s.startswith(self.obj.uri):
+                    part_id = s[len(self.obj.uri)+1:]
+                    r = Manifest(s)
+                    r.from_string(self.obj.get_part(part_id))
+                    r.checkpoint()
+                    self.parts_objs[s] = r
+                elif s.startswith("http://"):
+                    r = Manifest(s)
+                    r.from_url(s)
+                    r.checkpoint()
+                    self.parts_objs[s] = r
+        # reset mimetypes for core manifest - unless they are right already,
+        # so an untouched manifest doesn't count as altered
+        rdfxml = Literal(u"application/rdf+xml")
+        for item in ("ROOT", "MANIFEST"):
+            item_uri = "%s/%s" % (self.uri, item)
+            if manifest.list_objects(item_uri, "dc:format") == [rdfxml]:
+                continue
+            try:
+                manifest.del_triple(item_uri, "dc:format", None)
+            except:
+                pass
+            manifest.add_triple(item_uri, "dc:format", "application/rdf+xml")
 
     @_init_obj_wrapper
     def add_named_graph(self, graph_id, valid_from=None, valid_until=None):
@@ -9,14 +9,50 @@ from xml.sax.xmlreader import InputSource
 
 from StringIO import StringIO
 
+import hashlib
+
 from urihelper import URIHelper, NAMESPACES
 
-import re
+from termtable import TermTable
+
+from streamwriter import get_writer, nt_term
+from streamparser import SubjectSink, parse_stream, parse_turtle_block, STREAM_PARSE_FORMATS
+from streamparser import StreamParseException
+
+# prefixes every RDFobject starts out with
+DEFAULT_NAMESPACES = [(u'rdf', u'http://www.w3.org/1999/02/22-rdf-syntax-ns#'),
+                      (u'rdfs', u"http://www.w3.org/2000/01/rdf-schema#"),
+                      (u'dcterms', u"http://purl.org/dc/terms/"),
+                      (u'ov', u'http://open.vocab.org/terms/'),
+                      (u'ore', u'http://www.openarchives.org/ore/terms/')]
+
+class SharedNamespaces(dict):
+    """A prefix -> namespace table shared by several objects, such as the
+    items of a Manifest. generation goes up with every change, so that an
+    object can tell its cached output was made with other bindings."""
+    generation = 0
+
+    def __setitem__(self, prefix, ns):
+        dict.__setitem__(self, prefix, ns)
+        self.generation += 1
 
-# parse the P and Literal part of a encoded N3 line
-NTHREE_PL_P = re.compile(r'([^\s]+?):([^\s]+?)\s*"([^\s]+)"\s*\;?$')
-# parse the P and URIRef part of a N3 line
-NTHREE_PURI_P = re.compile(r'([^\s]+?):([^\s]+?)\s*([^\s]+?):([^\s]+?)\s*\;?$')
+    def __delitem__(self, prefix):
+        dict.__delitem__(self, prefix)
+        self.generation += 1
+
+# parser/serializer names that read and write the same syntax
+FORMAT_FAMILIES = {'ntriples':'nt', 'ttl':'turtle', 'n3':'turtle'}
+
+def same_format(a, b):
+    return FORMAT_FAMILIES.get(a, a) == FORMAT_FAMILIES.get(b, b)
+
+# digests are sums of per-statement md5s, modulo this
+DIGEST_MODULUS = 2 ** 128
+
+def statement_digest(s, p, o):
+    """md5 of the statement's N-Triples line, as an integer"""
+    line = u'%s %s %s .' % (nt_term(s), nt_term(p), nt_term(o))
+    return int(hashlib.md5(line.encode('utf-8')).hexdigest(), 16)
 
 class URINotSetException(Exception):
     """The URI has not been set. This object cannot be serialised or otherwise transcribed with the given value."""
@@ -41,37 +77,92 @@ def _cause_new_revision(fn):
     def new(self, *args, **kw):
         if not self.altered:
             self.altered = True
+        if self._shared:
+            # copy-on-write - see clone()
+            self._unshare()
+        self.revision += 1
         return fn(self, *args, **kw)
     return new
 
-class RDFobject(object):
+class RDFobjectBase(object):
+    """All of RDFobject's behaviour. It declares no instance storage of its
+    own - RDFobject keeps its state in an ordinary __dict__, CompactRDFobject
+    in fixed slots."""
+    __slots__ = ()
+
     def __init__(self, uri=None):
         self.reset()
         if uri:
             self.set_uri(uri)
     
     def reset(self):
+        if self._manifest_item():
+            # the manifest's namespace table and journal stay
+            self._clear_statements()
+            return
         self.namespaces = {}
+        self.journal = []
+        self._reset_statements()
+        #add defaults
+        self.urihelper = URIHelper(self.namespaces)
+        for prefix, ns in DEFAULT_NAMESPACES:
+            self.add_namespace(prefix, ns)
+    
+    def _reset_statements(self):
         self.triples = set([])
+        # predicate -> set of objects, kept in step with self.triples
+        self._predicates = {}
         self.types = set([])
         self.g = None
         self.altered = False
         self._cached = False
-        #add defaults
-        self.urihelper = URIHelper(self.namespaces)
-        self.add_namespace(u'rdf', u'http://www.w3.org/1999/02/22-rdf-syntax-ns#')
-        self.add_namespace(u'rdfs', u"http://www.w3.org/2000/01/rdf-schema#")
-        self.add_namespace(u'dcterms', u"http://purl.org/dc/terms/")
-        self.add_namespace(u'ov', u'http://open.vocab.org/terms/')
-        self.add_namespace(u'ore', u'http://www.openarchives.org/ore/terms/')
-    
+        # bumped by every mutator; to_string output is cached against it
+        self.revision = 0
+        self._serialised = None
+        self._serialised_at = None
+        self._digest = None
+        self._digest_at = None
+        # True while the containers above may be shared with a clone
+        self._shared = False
+        # True for a clone still using a Manifest's namespace table
+        self._borrowed_namespaces = False
+
+    def _manifest_item(self):
+        """True if this is one of a Manifest's items, sharing its namespace
+        table and journal (a clone of one is not)"""
+        return isinstance(getattr(self, 'namespaces', None), SharedNamespaces) and \
+               not getattr(self, '_borrowed_namespaces', False)
+
+    def _clear_statements(self):
+        """Drop every statement, journalling them as removed"""
+        self._journal('del', [(NAMESPACES['rdf']['type'], t) for t in self.types])
+        self._journal('del', list(self.triples))
+        self._reset_statements()
+
+    def _journal(self, op, statements):
+        """Record (predicate, object) pairs that were actually added ('add')
+        or removed ('del') as (op, s, p, o) entries in the journal"""
+        s = getattr(self, 'uri', None)
+        self.journal.extend([(op, s, p, o) for p, o in statements])
+
+    def checkpoint(self):
+        """Hand back the journal of changes made since the last checkpoint,
+        oldest first, and start a new one"""
+        journal = list(self.journal)
+        # emptied in place - Manifest items share their manifest's journal
+        del self.journal[:]
+        return journal
+
     @_cause_new_revision
     def add_type(self, uri_of_type):
         uri = self.urihelper.parse_uri(uri_of_type)
-        self.types.add(uri)
+        if uri not in self.types:
+            self.types.add(uri)
+            self._journal('add', [(NAMESPACES['rdf']['type'], uri)])
 
     def set_type(self, uri_of_type):
         """Clears all other types to set this to be singularly-typed"""
+        self._journal('del', [(NAMESPACES['rdf']['type'], t) for t in self.types])
         self.types = set([])
         self.add_type(uri_of_type)
 
@@ -80,28 +171,81 @@ class RDFobject(object):
         uri = self.urihelper.parse_uri(uri_of_type)
         if uri in self.types:
             self.types.remove(uri)
+            self._journal('del', [(NAMESPACES['rdf']['type'], uri)])
     
     def set_uri(self, uri):
         self.uri = self.urihelper.parse_uri(uri)
+        self.revision += 1
+
+    # statement state a clone starts out sharing
+    CLONED = ('namespaces', 'urihelper', 'triples', '_predicates', 'types', 'g', 'altered',
+              '_cached', 'revision', '_digest', '_digest_at')
+
+    def clone(self, uri=None):
+        """A copy of this object (with a new uri, if one is given) made in
+        constant time. The copy shares this object's triple, type and
+        namespace containers; whichever of the two changes first copies them."""
+        c = self._blank()
+        for name in self.CLONED:
+            setattr(c, name, getattr(self, name))
+        if hasattr(self, 'uri'):
+            c.uri = self.uri
+        c.journal = []
+        c._serialised = None
+        c._serialised_at = None
+        c._shared = self._shared = True
+        # a Manifest's table stays with the manifest - see _own_namespaces()
+        c._borrowed_namespaces = isinstance(self.namespaces, SharedNamespaces)
+        if uri:
+            c.set_uri(uri)
+        return c
+
+    def _blank(self):
+        """An uninitialised instance for clone() to fill in"""
+        return object.__new__(self.__class__)
+
+    def _unshare(self):
+        self.triples = set(self.triples)
+        self._predicates = dict([(p, set(objects)) for p, objects in self._predicates.iteritems()])
+        self.types = set(self.types)
+        if not isinstance(self.namespaces, SharedNamespaces):
+            self.namespaces = dict(self.namespaces)
+        self._shared = False
+
+    def _own_namespaces(self):
+        """Give a clone of a Manifest item a namespace table of its own, so
+        that changing its namespaces doesn't change the manifest's"""
+        if self._borrowed_namespaces:
+            self.namespaces = dict(self.namespaces)
+            self._borrowed_namespaces = False
     
     def add_namespace(self, prefix, uri):
+        if self._shared:
+            self._unshare()
+        self._own_namespaces()
         self.namespaces[prefix] = self.urihelper.get_namespace(uri)
+        self.revision += 1
         if prefix not in self.urihelper.namespaces:
-            self.urihelper.namespaces[prefix] = self.urihelper.get_namespace(uri)
+            # replace=False - another thread may have bound it meanwhile
+            self.urihelper.add_namespace(prefix, self.urihelper.get_namespace(uri), replace=False)
 
     def del_namespace(self, prefix):
         if prefix in self.namespaces:
+            if self._shared:
+                self._unshare()
+            self._own_namespaces()
             del self.namespaces[prefix]
+            self.revision += 1
 
     def triple_exists(self, predicate, objectRef):
         if not isinstance(objectRef, URIRef) and not isinstance(objectRef, Literal):
             objectRef = self.urihelper.parse_uri(objectRef, return_Literal_not_Exception=True)
         predicate_uri = self.urihelper.parse_uri(predicate)
-        return (predicate_uri, objectRef) in self.triples
+        return objectRef in self._predicates.get(predicate_uri, ())
 
     def list_objects(self, predicate):
         predicate_uri = self.urihelper.parse_uri(predicate)
-        return [x[1] for x in self.triples if x[0] == predicate_uri]
+        return list(self._predicates.get(predicate_uri, ()))
 
     @_cause_new_revision    
     def add_triple(self, predicate, objectRef):
@@ -114,44 +258,152 @@ class RDFobject(object):
                 self.add_type(objectRef)
             else:
                 self.triples.add((predicate_uri, objectRef))
+                self._predicates.setdefault(predicate_uri, set([])).add(objectRef)
+                self._journal('add', [(predicate_uri, objectRef)])
 
     @_cause_new_revision    
     def del_triple(self, predicate, objectRef=None):
         predicate_uri = self.urihelper.parse_uri(predicate)
-        if objectRef:
+        if objectRef is not None:
             if not isinstance(objectRef, URIRef) and not isinstance(objectRef, Literal):
                 objectRef = self.urihelper.parse_uri(objectRef, return_Literal_not_Exception=True)
             if (predicate_uri, objectRef) in self.triples:
                 self.triples.remove((predicate_uri, objectRef))
+                objects = self._predicates[predicate_uri]
+                objects.discard(objectRef)
+                if not objects:
+                    del self._predicates[predicate_uri]
+                self._journal('del', [(predicate_uri, objectRef)])
         else:
-            self.triples = set([t for t in self.triples if t[0] != predicate_uri])
+            objects = self._predicates.pop(predicate_uri, None)
+            if objects:
+                self.triples.difference_update([(predicate_uri, o) for o in objects])
+                self._journal('del', [(predicate_uri, o) for o in objects])
+
+    def _resolver(self):
+        """parse_uri for predicates, remembering each distinct value it has seen"""
+        resolved = {}
+        parse_uri = self.urihelper.parse_uri
+        def resolve(predicate):
+            try:
+                return resolved[predicate]
+            except KeyError:
+                resolved[predicate] = parse_uri(predicate)
+                return resolved[predicate]
+        return resolve
 
     @_cause_new_revision
+    def add_triples(self, statements):
+        """Add an iterable of (predicate, object) pairs in one go. Each distinct
+        predicate is resolved once and the object only bumps its revision once."""
+        resolve = self._resolver()
+        parse_uri = self.urihelper.parse_uri
+        rdf_type = NAMESPACES['rdf']['type']
+        statements = list(statements)
+        objects = self.urihelper.parse_many([o for p, o in statements])
+        by_predicate = {}
+        types = set([])
+        for (predicate, original), objectRef in zip(statements, objects):
+            predicate_uri = resolve(predicate)
+            if predicate_uri == rdf_type:
+                # a type has to be a URI - no Literal fallback
+                types.add(parse_uri(original))
+                continue
+            by_predicate.setdefault(predicate_uri, set([])).add(objectRef)
+        types -= self.types
+        self.types.update(types)
+        self._journal('add', [(rdf_type, t) for t in types])
+        for predicate_uri, objects in by_predicate.iteritems():
+            current = self._predicates.setdefault(predicate_uri, set([]))
+            objects -= current
+            current.update(objects)
+            pairs = [(predicate_uri, o) for o in objects]
+            self.triples.update(pairs)
+            self._journal('add', pairs)
+
+    @_cause_new_revision
+    def del_triples(self, statements):
+        """Remove an iterable of (predicate, object) pairs in one go. As with
+        del_triple, an object of None removes every value of the predicate."""
+        resolve = self._resolver()
+        parse_uri = self.urihelper.parse_uri
+        wildcards = set([])
+        by_predicate = {}
+        for predicate, objectRef in statements:
+            predicate_uri = resolve(predicate)
+            if objectRef is None:
+                wildcards.add(predicate_uri)
+                continue
+            if not isinstance(objectRef, URIRef) and not isinstance(objectRef, Literal):
+                objectRef = parse_uri(objectRef, return_Literal_not_Exception=True)
+            by_predicate.setdefault(predicate_uri, set([])).add(objectRef)
+        for predicate_uri in wildcards:
+            objects = self._predicates.pop(predicate_uri, None)
+            if objects:
+                pairs = [(predicate_uri, o) for o in objects]
+                self.triples.difference_update(pairs)
+                self._journal('del', pairs)
+        for predicate_uri, objects in by_predicate.iteritems():
+            current = self._predicates.get(predicate_uri)
+            if current:
+                objects &= current
+                current.difference_update(objects)
+                pairs = [(predicate_uri, o) for o in objects]
+                self.triples.difference_update(pairs)
+                self._journal('del', pairs)
+                if not current:
+                    del self._predicates[predicate_uri]
+
     def add_n3_triple(self, text):
-        if NTHREE_PL_P.search(text):
-            prefix, predicate, objectRef = NTHREE_PL_P.search(text).groups()
-            objectRef = Literal(objectRef)
-            self.add_triple(prefix, predicate, objectRef)
-        elif NTHREE_PURI_P.search(text):
-            prefix, predicate, obj_prefix, objectRef = NTHREE_PURI_P.search(text).groups()
-            if obj_prefix not in ['http', 'info', 'urn', 'ftp', 'https']:
-                self.add_triple(self.urihelper.uriref_shorthand_uri(prefix, predicate), self.urihelper.uriref_shorthand_uri(obj_prefix, objectRef))
-            else:
-                self.add_triple( self.urihelper.uriref_shorthand_uri(prefix, predicate), self.urihelper.parse_uri(":".join([obj_prefix, objectRef]), return_Literal_not_Exception=True) )
-        else:
-            raise N3NotUnderstoodException()
+        self.add_n3_triples(text)
+
+    def add_n3_triples(self, text):
+        """Add a block of Turtle statements about this object - predicate-object
+        lists such as 'dc:title "A title" ; dcterms:creator info:fedora/p:1 .' -
+        in one batch. Prefixes are looked up in this object's namespaces (and
+        the global ones); any @prefix lines in the block are added to them."""
+        statements = []
+        sink = SubjectSink(None, lambda s, p, o: statements.append((p, o)))
+        try:
+            parse_turtle_block(text, None, sink, self.get_bindings())
+        except StreamParseException, e:
+            raise N3NotUnderstoodException(unicode(e))
+        for prefix, ns in sink.namespaces.items():
+            self.add_namespace(prefix, ns)
+        self.add_triples(statements)
 
-    def from_string(self, uri, text, format="xml", encoding="utf-8"):
+    def from_string(self, uri, text, format="xml", encoding="utf-8", streaming=False):
+        """Load the triples about uri from text. With streaming=True, N-Triples
+        and RDF/XML are read statement by statement and anything about other
+        subjects is dropped as it is read, rather than parsing the whole
+        document into a graph first. What is loaded is the new checkpoint,
+        so the journal starts out empty - except for a Manifest's item, where
+        the load is journalled in the manifest like any other change."""
         self.reset()
         self.set_uri(uri)
-        t = TextInputSource(text, system_id=uri)
+        if streaming and format in STREAM_PARSE_FORMATS:
+            statements = []
+            sink = SubjectSink(self.uri, lambda p, o: statements.append((p, o)))
+            parse_stream(text, format, sink, system_id=uri, encoding=encoding)
+            for prefix, ns in sink.namespaces.items():
+                self.add_namespace(prefix, ns)
+            self.add_triples(statements)
+            if not self._manifest_item():
+                self.checkpoint()
+            return
+        if format == "n3":
+            # rdflib's N3 parser can't resolve against an info: or urn: base
+            t = TextInputSource(text)
+        else:
+            t = TextInputSource(text, system_id=uri)
         t.setEncoding(encoding)
         g = ConjunctiveGraph(identifier=self.uri)
-        g = g.parse(t, format)
+        g = g.parse(t, format=format)
         for prefix, ns in g.namespaces():
             self.add_namespace(prefix, ns)
-        for s,p,o in g.triples((self.uri, None, None)):
-            self.add_triple(p, o)
+        self.add_triples([(p, o) for s,p,o in g.triples((self.uri, None, None))])
+        if not self._manifest_item():
+            self.checkpoint()
 
     
     def from_url(self, url, uri=None, format="xml",  encoding="utf-8"):
@@ -161,11 +413,12 @@ class RDFobject(object):
         else:
             self.set_uri(uri)
         g = ConjunctiveGraph(identifier=self.uri)
-        g = g.parse(url, format)
+        g = g.parse(url, format=format)
         for prefix, ns in g.namespaces():
             self.add_namespace(prefix, ns)
-        for s,p,o in g.triples((self.uri, None, None)):
-            self.add_triple(p, o)
+        self.add_triples([(p, o) for s,p,o in g.triples((self.uri, None, None))])
+        if not self._manifest_item():
+            self.checkpoint()
     
     def get_graph(self):
         if not self.uri:
@@ -186,6 +439,61 @@ class RDFobject(object):
             g.add((self.uri, triple[0], triple[1]))
         return g
 
+    def list_statements(self):
+        """(predicate, object) pairs, types first and then grouped by predicate"""
+        rdf_type = NAMESPACES['rdf']['type']
+        for type in self.types:
+            yield (rdf_type, type)
+        for predicate in self._predicates:
+            for objectRef in self._predicates[predicate]:
+                yield (predicate, objectRef)
+
+    def match(self, predicate=None, objectRef=None):
+        """(predicate, object) pairs matching the given resolved terms, None
+        matching anything - answered from the predicate and type sets"""
+        rdf_type = NAMESPACES['rdf']['type']
+        if predicate is not None:
+            if predicate == rdf_type:
+                objects = self.types
+            else:
+                objects = self._predicates.get(predicate, ())
+            if objectRef is None:
+                for o in objects:
+                    yield (predicate, o)
+            elif objectRef in objects:
+                yield (predicate, objectRef)
+        elif objectRef is not None:
+            if objectRef in self.types:
+                yield (rdf_type, objectRef)
+            for p, objects in self._predicates.iteritems():
+                if objectRef in objects:
+                    yield (p, objectRef)
+        else:
+            for statement in self.list_statements():
+                yield statement
+
+    def _digest_sum(self):
+        if self._digest_at != self.revision:
+            total = 0
+            for p, o in self.list_statements():
+                total += statement_digest(self.uri, p, o)
+            self._digest = total % DIGEST_MODULUS
+            self._digest_at = self.revision
+        return self._digest
+
+    def digest(self):
+        """Digest of this object's triples, as 32 hex digits. It doesn't depend
+        on the order they were added in or on the namespace bindings, so two
+        objects holding the same triples have the same digest."""
+        return '%032x' % self._digest_sum()
+
+    def get_bindings(self):
+        """prefix -> namespace map used for output; this object's own
+        bindings take precedence over the global ones"""
+        bindings = dict(self.urihelper.namespaces)
+        bindings.update(self.namespaces)
+        return bindings
+
     def list_triples(self):
         """output a list of the triple tuples - Should really make this a generator, but anyway."""
         triples = []
@@ -206,21 +514,165 @@ class RDFobject(object):
         """ ** NOTE ** This only adds the property and object pairs, and discards the subject """
         for prefix, ns in g.namespaces():
             self.add_namespace(prefix, ns)
-        for s,p,o in g.triples((None, None, None)):
-            self.add_triple(p, o)
+        self.add_triples([(p, o) for s,p,o in g.triples((None, None, None))])
 
     @_cause_new_revision
     def munge_graph(self, g):
         """ This will only add the triples that have this object's subject as their subject. """
         for prefix, ns in g.namespaces():
             self.add_namespace(prefix, ns) 
-        for s,p,o in g.triples((self.uri, None, None)):
-            self.add_triple(p, o)
+        self.add_triples([(p, o) for s,p,o in g.triples((self.uri, None, None))])
     
     def __str__(self):
         return self.to_string('xml')
     
     def to_string(self, format="xml"):
-        return self.get_graph().serialize(format=format, encoding="utf-8")+"\n"
+        # The global prefix bindings end up in the output too, so a change
+        # to them invalidates the cache as well as a change to this object
+        # (or to a namespace table it shares)
+        state = (self.revision, self.urihelper.generation,
+                 getattr(self.namespaces, 'generation', None))
+        if self._serialised is None or self._serialised_at != state:
+            self._serialised = {}
+            self._serialised_at = state
+        if format not in self._serialised:
+            self._serialised[format] = self.get_graph().serialize(format=format, encoding="utf-8")+"\n"
+        return self._serialised[format]
+
+    def to_stream(self, out, format="nt"):
+        """Write to a file-like object. N-Triples and Turtle are written
+        straight from the triples, without building a graph; any other format
+        goes through to_string."""
+        w = get_writer(format, out, self.get_bindings())
+        if w is None:
+            out.write(self.to_string(format))
+            return
+        if not getattr(self, 'uri', None):
+            raise URINotSetException()
+        w.subject(self.uri, self.list_statements())
         
 
+class RDFobject(RDFobjectBase):
+    pass
+
+class LazyRDFobject(RDFobject):
+    """An RDFobject read from storage, holding the stored bytes (with the
+    version and checksum they were stored under) and only parsing them when
+    its statements are first needed. Until it is changed, to_string and
+    to_stream in the format it was stored in hand back those bytes as they are."""
+    def __init__(self, uri, raw, format="xml", version=None, checksum=None):
+        # stored_digest is the digest() of what was read, once it is parsed
+        self.loaded = False
+        self.uri = uri
+        self.raw = raw
+        self.format = format
+        self.version = version
+        self.checksum = checksum
+        self.altered = False
+        self._pristine_at = None
+        self.stored_digest = None
+
+    def __getattr__(self, name):
+        # only reached for attributes that aren't set - before parsing, that
+        # is all of the statement state
+        if name.startswith('__') or self.__dict__.get('loaded', True):
+            raise AttributeError(name)
+        self.load()
+        return getattr(self, name)
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        # a mutator may have flagged the change that caused the load
+        altered = self.altered
+        self.from_string(self.uri, self.raw, format=self.format, streaming=True)
+        self.altered = altered
+        self._pristine_at = self.revision
+        self.stored_digest = self.digest()
+
+    def checkpoint(self):
+        if not self.loaded:
+            return []
+        return RDFobject.checkpoint(self)
+
+    def _blank(self):
+        # a clone is an ordinary RDFobject - it has no stored bytes
+        return object.__new__(RDFobject)
+
+    def is_pristine(self, format):
+        """True if the stored bytes are still this object in format"""
+        return same_format(format, self.format) and \
+               (not self.loaded or self.revision == self._pristine_at)
+
+    def to_string(self, format="xml"):
+        if self.is_pristine(format):
+            return self.raw
+        return RDFobject.to_string(self, format)
+
+    def to_stream(self, out, format="nt"):
+        if self.is_pristine(format):
+            out.write(self.raw)
+            return
+        RDFobject.to_stream(self, out, format)
+
+class CompactRDFobject(RDFobjectBase):
+    """A slotted RDFobject for holding large numbers of Manifest items.
+
+    It has no __dict__, takes the namespace table and URIHelper handle it is
+    given by reference (normally the owning Manifest's) rather than building
+    its own, and interns every term it stores in the TermTable it is given
+    (again, normally the Manifest's), so that identical URIRefs and Literals
+    across items are held once."""
+    __slots__ = ('uri', 'namespaces', 'urihelper', 'triples', '_predicates', 'types',
+                 'g', 'altered', '_cached', 'revision', '_serialised', '_serialised_at',
+                 '_digest', '_digest_at', '_shared', '_borrowed_namespaces',
+                 'terms', 'journal')
+
+    def __init__(self, uri, namespaces, urihelper, terms=None):
+        self.namespaces = namespaces
+        self.urihelper = urihelper
+        if terms is None:
+            terms = TermTable()
+        self.terms = terms
+        self.journal = []
+        self._reset_statements()
+        self.set_uri(uri)
+
+    def reset(self):
+        # the namespace table and journal are shared - only this item's
+        # statements go
+        self._clear_statements()
+
+    def _blank(self):
+        c = object.__new__(CompactRDFobject)
+        c.terms = self.terms
+        return c
+
+    def _unshare(self):
+        # the namespace table is meant to be shared, so it stays that way
+        namespaces = self.namespaces
+        RDFobjectBase._unshare(self)
+        self.namespaces = namespaces
+
+    def _term(self, term, return_Literal_not_Exception=False):
+        if not isinstance(term, URIRef) and not isinstance(term, Literal):
+            term = self.urihelper.parse_uri(term, return_Literal_not_Exception)
+        return self.terms.intern(term)
+
+    def set_uri(self, uri):
+        RDFobjectBase.set_uri(self, self._term(uri))
+
+    def add_type(self, uri_of_type):
+        RDFobjectBase.add_type(self, self._term(uri_of_type))
+
+    def add_triple(self, predicate, objectRef):
+        RDFobjectBase.add_triple(self, self._term(predicate), self._term(objectRef, True))
+
+    def add_triples(self, statements):
+        statements = list(statements)
+        objects = self.urihelper.parse_many([o for p, o in statements])
+        # each distinct predicate is parsed once, as in RDFobjectBase.add_triples
+        resolve = self._resolver()
+        intern = self.terms.intern
+        RDFobjectBase.add_triples(self, [(intern(resolve(p)), intern(o)) for (p, _), o in zip(statements, objects)])
@@ -26,6 +26,15 @@ FS convention for versionable items:
 XXXX is just an autoincrementing number - largest is the latest and the FS
 contains the ctime and the mtime of the file.
 
+Sharded manifests (manifest_shards=N):
+
+{id_path}/MANIFEST/_XXXX => JSON index - the version and digest of each shard
+{id_path}/MANIFEST.shards/{bucket}/{bucket}_YYYY => Manifest RDF for the items
+                                                   hashed into that bucket
+
+Items are bucketed by the part they describe, so a part and its versions
+share a shard and storing a manifest only writes the shards that changed.
+
 # TODO - add a simple method to view version numbers, and delete them
 # deletion will retain the sequence of course.
 """
@@ -36,7 +45,13 @@ import codecs
 
 import string
 
-from rdfobject import RDFobject
+import hashlib
+
+from tempfile import SpooledTemporaryFile
+
+from rdfobject import RDFobject, LazyRDFobject
+
+from rdfobject.streamwriter import STREAM_FORMATS
 
 from pairtree import PairtreeStorageClient
 
@@ -44,7 +59,7 @@ from storage_exceptions import ObjectNotFoundException, ObjectAlreadyExistsExcep
                                NotAPairtreeStoreException, VersionNotFoundException, \
                                PartNotFoundException
 
-from rdfobject.constructs import Manifest, ItemAlreadyExistsException, ItemDoesntExistException
+from rdfobject.constructs import Manifest, LazyManifest, ItemAlreadyExistsException, ItemDoesntExistException
 
 from rdflib import Namespace
 
@@ -57,11 +72,22 @@ import random
 URI_BASE = "info:local/"
 STORAGE_DIR = "./rdffilestore"
 SPECIAL_FILE_PREFIX = "_"
+# Format ROOT and MANIFEST are written in. 'nt' and 'turtle' are streamed out
+# without building an rdflib graph; reading works out the format from the file.
+RDF_FORMAT = "xml"
+# Serialised RDF larger than this is spooled to a temp file rather than memory
+SPOOL_SIZE = 1024 * 1024
+# Number of shards MANIFEST is split into - None keeps it as one file. Reading
+# works out which layout a stored manifest uses.
+MANIFEST_SHARDS = None
+SHARD_DIR = "%s.shards"
 
 class FileStorageFactory(object):
     def get_store(self, uri_base=URI_BASE, store_dir=STORAGE_DIR, prefix=SPECIAL_FILE_PREFIX,
-    shorty_length=2, queue=None, hashing_type=None, **context):
-        return FileStorageClient(uri_base, store_dir, prefix, shorty_length, queue, hashing_type, **context)
+    shorty_length=2, queue=None, hashing_type=None, rdf_format=RDF_FORMAT,
+    manifest_shards=MANIFEST_SHARDS, **context):
+        return FileStorageClient(uri_base, store_dir, prefix, shorty_length, queue, hashing_type,
+                                 rdf_format=rdf_format, manifest_shards=manifest_shards, **context)
 
 class FileStorageObject(object):
     def __init__(self, id, fs_store_client):
@@ -129,8 +155,11 @@ class FileStorageObject(object):
 
 
 class FileStorageClient(object):
-    def __init__(self, uri_base, store_dir, prefix, shorty_length,queue=None, hashing_type=None, **context):
+    def __init__(self, uri_base, store_dir, prefix, shorty_length,queue=None, hashing_type=None,
+                 rdf_format=RDF_FORMAT, manifest_shards=MANIFEST_SHARDS, **context):
         self.store_dir = store_dir
+        self.rdf_format = rdf_format
+        self.manifest_shards = manifest_shards
         self.uri_base = None
         if uri_base:
             self.uri_base = Namespace(uri_base)
@@ -163,10 +192,19 @@ class FileStorageClient(object):
             return 0
 
     def _list_parts(self, id):
-        return self.storeclient.list_parts(id)
+        parts = self.storeclient.list_parts(id)
+        # a sharded manifest's shards are kept beside it, not as a part
+        shard_dirs = set([SHARD_DIR % part_id for part_id in parts])
+        return [part_id for part_id in parts if part_id not in shard_dirs]
+
+    def _has_part(self, id, part_id):
+        if os.sep in part_id:
+            # a shard - its bucket name is too short for list_parts to show
+            return self.storeclient.exists(id, part_id)
+        return part_id in self.storeclient.list_parts(id)
 
     def _list_part_versions(self, id, part_id):
-        if part_id in self.storeclient.list_parts(id):
+        if self._has_part(id, part_id):
             versions = self.storeclient.list_parts(id, part_id)
             numbered_versions = [int(x.split(self.prefix)[-1]) for x in versions]
             if numbered_versions:
@@ -233,9 +271,10 @@ class FileStorageClient(object):
         if not version:
             version = self._get_latest_part(id, part_id) + 1
         part_name = "%s%s%s" % (part_id, self.prefix, version)
-        bytestream = manifest.to_string()
-        if isinstance(bytestream, unicode):
-            bytestream = bytestream.encode('utf-8')
+        if self.manifest_shards:
+            bytestream = self._store_shards(id, part_id, manifest)
+        else:
+            bytestream = self._serialise(manifest)
         hexhash = self.storeclient.put_stream(id, part_id, part_name, bytestream)
         if self.queue != None:
             if version == 1:
@@ -244,15 +283,61 @@ class FileStorageClient(object):
                 self._log(id, 'w', 'Updating an RDF Manifest', part_id=part_id, version=version, checksum=hexhash)
         return {'version':version, 'checksum':hexhash}
 
+    def _shard_of(self, id, item_uri):
+        """Bucket for an item - the part it describes is hashed, so that the
+        part and its versions are kept together"""
+        key = unicode(item_uri)
+        base = u"%s/" % self.uri_base[id]
+        if key.startswith(base):
+            key = key[len(base):].split(u'/', 1)[0]
+        bucket = int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16) % self.manifest_shards
+        return "%x" % bucket
+
+    def _shard_index(self, id, part_id, version=False):
+        """The JSON index of a sharded manifest as a dict, or None if the
+        stored manifest (if any) is a single file"""
+        try:
+            text = self._get_part(id, part_id, False, version)
+        except (PartNotFoundException, VersionNotFoundException):
+            return None
+        if text.lstrip().startswith('{'):
+            return simplejson.loads(text)
+
+    def _store_shards(self, id, part_id, manifest):
+        """Write out the shards whose items have changed since the last index
+        and return the new index. Every shard of a manifest is in the same
+        format, so if this store writes another one they are all rewritten."""
+        index = self._shard_index(id, part_id) or {}
+        previous = {}
+        if index.get('format') == self.rdf_format:
+            previous = index.get('shards', {})
+        buckets = {}
+        for item_uri in manifest.items_rdfobjects:
+            buckets.setdefault(self._shard_of(id, item_uri), []).append(item_uri)
+        shard_dir = SHARD_DIR % part_id
+        shards = {}
+        for bucket, item_uris in buckets.iteritems():
+            digest = manifest.digest(item_uris)
+            if bucket in previous and previous[bucket][1] == digest:
+                shards[bucket] = previous[bucket]
+                continue
+            # from what is on disk, not the index - a bucket that was emptied
+            # and has filled again must not overwrite its old shards
+            shard_path = os.path.join(shard_dir, bucket)
+            shard_version = self._get_latest_part(id, shard_path) + 1
+            shard_name = "%s%s%s" % (bucket, self.prefix, shard_version)
+            self.storeclient.put_stream(id, shard_path, shard_name,
+                                        self._serialise(manifest.select(item_uris)))
+            shards[bucket] = [shard_version, digest]
+        return simplejson.dumps({'shards':shards, 'format':self.rdf_format})
+
     def _store_rdfobject(self, id, part_id, rdfobject, version=False):
         if not self.storeclient.exists(id):
             raise ObjectNotFoundException
         if not version:
             version = self._get_latest_part(id, part_id) + 1
         part_name = "%s%s%s" % (part_id, self.prefix, version)
-        bytestream = rdfobject.to_string()
-        if isinstance(bytestream, unicode):
-            bytestream = bytestream.encode('utf-8')
+        bytestream = self._serialise(rdfobject)
         hexhash = self.storeclient.put_stream(id, part_id, part_name, bytestream)
         if self.queue != None:
             if version == 1:
@@ -261,31 +346,75 @@ class FileStorageClient(object):
                 self._log(id, 'w', 'Updating an RDF Root', part_id=part_id, version=version, checksum=hexhash)
         return {'version':version, 'checksum':hexhash}
 
+    def _serialise(self, rdf):
+        """Bytes (or a file-like object) for an RDFobject or Manifest in this
+        store's rdf_format"""
+        if self.rdf_format in STREAM_FORMATS:
+            bytestream = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+            rdf.to_stream(bytestream, self.rdf_format)
+            bytestream.seek(0)
+            return bytestream
+        bytestream = rdf.to_string(self.rdf_format)
+        if isinstance(bytestream, unicode):
+            bytestream = bytestream.encode('utf-8')
+        return bytestream
+
+    def _sniff_format(self, text):
+        """rdflib parser name for a stored ROOT/MANIFEST, whichever
+        rdf_format it was written in"""
+        head = text.lstrip()[:64]
+        if head.startswith('<?xml') or head.startswith('<rdf:RDF'):
+            return "xml"
+        elif head.startswith('@prefix'):
+            return "n3"
+        return "nt"
+
+    def _checksum(self, bytestream):
+        """(hashing_type, hexdigest) of stored bytes, as put_stream reports it"""
+        hashing_type = getattr(self, 'hashing_type', None)
+        if hashing_type:
+            return (hashing_type, getattr(hashlib, hashing_type)(bytestream).hexdigest())
 
     def _get_rdfobject(self, id, part_id, version = False):
+        """The stored RDF is only parsed once the returned LazyRDFobject's
+        statements are used"""
         if not self.storeclient.exists(id):
             raise ObjectNotFoundException
         if not version:
             version = self._get_latest_part(id, part_id)
         part_name = "%s%s%s" % (part_id, self.prefix, version)
-        r = RDFobject()
-        r.set_uri(self.uri_base[id])
         if version >= 1:
             f = self.storeclient.get_stream(id, part_id, part_name,streamable=False)
-            r.from_string(self.uri_base[id], f.decode('utf-8'))
+            return LazyRDFobject(self.uri_base[id], f, format=self._sniff_format(f),
+                                 version=version, checksum=self._checksum(f))
+        r = RDFobject()
+        r.set_uri(self.uri_base[id])
         return r
 
     def _get_manifest(self, id, part_id, file_uri, version = False):
+        """As with _get_rdfobject, a LazyManifest is parsed on first use"""
         if not self.storeclient.exists(id):
             raise ObjectNotFoundException
         if not version:
             version = self._get_latest_part(id, part_id)
         part_name = "%s%s%s" % (part_id, self.prefix, version)
-        m = Manifest(file_uri)
         if version >= 1:
             f = self.storeclient.get_stream(id, part_id, part_name,streamable=False)
-            m.from_string(f.decode('utf-8'))
-        return m
+            checksum = self._checksum(f)
+            if f.lstrip().startswith('{'):
+                # a sharded manifest's index - read each shard it lists
+                shard_dir = SHARD_DIR % part_id
+                f = [self.storeclient.get_stream(id, os.path.join(shard_dir, bucket),
+                                                 "%s%s%s" % (bucket, self.prefix, shard_version),
+                                                 streamable=False)
+                     for bucket, (shard_version, digest) in sorted(simplejson.loads(f)['shards'].items())]
+                if not f:
+                    return Manifest(file_uri)
+                return LazyManifest(file_uri, f, format=self._sniff_format(f[0]),
+                                    version=version, checksum=checksum)
+            return LazyManifest(file_uri, f, format=self._sniff_format(f),
+                                version=version, checksum=checksum)
+        return Manifest(file_uri)
 
     def exists(self, id):
         return self.storeclient.exists(id)
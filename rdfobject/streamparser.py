@@ -0,0 +1,267 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Subject-filtered RDF readers
+============================
+
+Reads N-Triples or RDF/XML and hands each statement to a sink as it is read,
+instead of parsing into an rdflib ConjunctiveGraph. A SubjectSink only passes
+on the statements about one subject, so the memory used is in proportion to
+what is kept, not to the size of the document.
+
+    sink = SubjectSink(uri, lambda p, o: ...)
+    parse_stream(text, "nt", sink)
+    sink.namespaces  # prefixes declared in the document
+
+parse_turtle_block reads the subject-less Turtle that RDFobject.add_n3_triples
+takes - predicate-object lists, with @prefix directives - the same way.
+"""
+
+import re
+
+from StringIO import StringIO
+
+from xml.sax import make_parser
+from xml.sax.handler import ErrorHandler, feature_namespaces
+from xml.sax.xmlreader import InputSource
+
+from rdflib import URIRef, Literal, BNode, Namespace
+
+try:
+    from rdflib.syntax.parsers.RDFXMLHandler import RDFXMLHandler
+except ImportError:
+    from rdflib.plugins.parsers.rdfxml import RDFXMLHandler
+
+from streamwriter import nt_term, RDF_TYPE
+from urihelper import URI_P
+
+XSD = Namespace(u"http://www.w3.org/2001/XMLSchema#")
+
+# Formats parse_stream can read
+STREAM_PARSE_FORMATS = ['nt', 'xml']
+
+class StreamParseException(Exception):
+    """A statement in the document could not be read"""
+    pass
+
+class SubjectSink(object):
+    """Receives statements from the parsers; only those whose subject is
+    `subject` (or all of them, if subject is None) are passed on to fn(p, o)
+    - or fn(s, p, o) when unfiltered."""
+    def __init__(self, subject, fn):
+        self.subject = subject
+        self.fn = fn
+        self.namespaces = {}
+
+    def add(self, triple):
+        s, p, o = triple
+        if self.subject is None:
+            self.fn(s, p, o)
+        elif s == self.subject:
+            self.fn(p, o)
+
+    def bind(self, prefix, namespace, override=True):
+        if override or prefix not in self.namespaces:
+            self.namespaces[prefix] = namespace
+
+# N-Triples statement: subject, predicate, rest-of-line (object)
+NT_STATEMENT = re.compile(r'(<[^>]*>|_:[A-Za-z][A-Za-z0-9]*)\s+<([^>]*)>\s+(.*?)\s*\.\s*$')
+NT_LITERAL = re.compile(r'"((?:[^"\\]|\\.)*)"(?:@([a-zA-Z]+(?:-[a-zA-Z0-9]+)*)|\^\^<([^>]*)>)?$')
+# (Turtle's extra \b, \f and \' escapes are accepted as well)
+NT_ESCAPE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|[tnrbf"\'\\])')
+_NT_UNESCAPES = {'t':u'\t', 'n':u'\n', 'r':u'\r', 'b':u'\b', 'f':u'\f',
+                 '"':u'"', "'":u"'", '\\':u'\\'}
+
+def _unescape_char(m):
+    code = m.group(1)
+    if len(code) == 1:
+        return _NT_UNESCAPES[code]
+    # via unicode_escape so narrow builds get a surrogate pair for \U
+    return ('\\' + str(code)).decode('unicode_escape')
+
+def nt_unescape(text):
+    if '\\' not in text:
+        return text
+    return NT_ESCAPE.sub(_unescape_char, text)
+
+def _nt_node(text):
+    if text.startswith('<'):
+        return URIRef(nt_unescape(text[1:-1]))
+    return BNode(text[2:])
+
+def parse_ntriples(text, sink):
+    """Feed the statements in an N-Triples document to sink. If the sink is
+    filtering on a subject, lines about anything else are skipped on a plain
+    prefix comparison, without being parsed."""
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    prefix = None
+    if sink.subject is not None:
+        # '<uri>' - the closing > means no other subject can share this prefix
+        prefix = nt_term(sink.subject)
+    for line in StringIO(text):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if prefix is not None and not line.startswith(prefix):
+            continue
+        m = NT_STATEMENT.match(line)
+        if not m:
+            raise StreamParseException(line)
+        s, p, o = m.groups()
+        if o.startswith('"'):
+            lm = NT_LITERAL.match(o)
+            if not lm:
+                raise StreamParseException(line)
+            lexical, lang, datatype = lm.groups()
+            if datatype:
+                o = Literal(nt_unescape(lexical), datatype=URIRef(nt_unescape(datatype)))
+            else:
+                o = Literal(nt_unescape(lexical), lang=lang)
+        else:
+            o = _nt_node(o)
+        sink.add((_nt_node(s), URIRef(nt_unescape(p)), o))
+
+def parse_rdfxml(text, sink, system_id=None, encoding="utf-8"):
+    """Feed the statements in an RDF/XML document to sink, using rdflib's
+    SAX handler so statements arrive as each element closes."""
+    if isinstance(text, unicode):
+        text = text.encode(encoding)
+    source = InputSource(system_id)
+    source.setByteStream(StringIO(text))
+    source.setEncoding(encoding)
+    parser = make_parser()
+    # see rdflib's RDFXMLParser - expat needs the xml prefix declared up front
+    parser.start_namespace_decl("xml", "http://www.w3.org/XML/1998/namespace")
+    parser.setFeature(feature_namespaces, 1)
+    handler = RDFXMLHandler(sink)
+    handler.setDocumentLocator(source)
+    parser.setContentHandler(handler)
+    parser.setErrorHandler(ErrorHandler())
+    parser.parse(source)
+
+def parse_stream(text, format, sink, system_id=None, encoding="utf-8"):
+    if format == "nt":
+        parse_ntriples(text, sink)
+    elif format == "xml":
+        parse_rdfxml(text, sink, system_id, encoding)
+    else:
+        raise StreamParseException("Cannot stream parse format '%s'" % format)
+
+# Turtle tokens; whitespace and comments match without a named group
+TTL_TOKEN = re.compile(r'''
+    \s+ | \#[^\n]*
+  | (?P<iri><[^>]*>)
+  | (?P<long>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\')
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | @(?P<lang>[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)
+  | (?P<datatype>\^\^)
+  | (?P<number>[+-]?(?:\d+(?:\.\d*)?[eE][+-]?\d+|\.\d+[eE][+-]?\d+|\d*\.\d+|\d+))
+  | (?P<pname>(?P<prefix>[A-Za-z][\w\-]*)?:(?P<local>(?:[^\s;,.()\[\]<>"']|\.(?=[^\s;,.()\[\]<>"']))*))
+  | (?P<word>[A-Za-z]+)
+  | (?P<punct>[;,.])
+''', re.X | re.S)
+
+def _ttl_tokens(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        m = TTL_TOKEN.match(text, pos)
+        if not m or m.end() == pos:
+            raise StreamParseException(text[pos:pos+40])
+        pos = m.end()
+        if m.lastgroup:
+            tokens.append((m.lastgroup, m))
+    return tokens
+
+def _ttl_uri(kind, m, namespaces):
+    if kind == 'iri':
+        return URIRef(nt_unescape(m.group('iri')[1:-1]))
+    elif kind == 'pname':
+        prefix = m.group('prefix') or u''
+        if prefix in namespaces:
+            return URIRef(u'%s%s' % (namespaces[prefix], m.group('local')))
+        elif URI_P.match(m.group('pname')):
+            # not a prefix - a URI in its own right, as in info:fedora/ora:1
+            # or http://example.org/
+            return URIRef(m.group('pname'))
+    raise StreamParseException(m.group(0))
+
+def parse_turtle_block(text, subject, sink, namespaces=None):
+    """Feed a block of Turtle predicate-object lists about subject to sink:
+
+        @prefix foaf: <http://xmlns.com/foaf/0.1/> .
+        a foaf:Agent ;
+            dc:title "A title", '''A long,
+                multi-line title'''@en ;
+            dc:relation info:fedora/ora:2 .
+
+    Prefixed names are resolved against namespaces (prefix -> namespace)
+    and any @prefix lines earlier in the block, which are also passed to
+    sink.bind. As well as ; and , and . a new line may simply start the next
+    predicate, so text that used to go to add_n3_triple a line at a time can
+    be handed over in one piece."""
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    namespaces = dict(namespaces or {})
+    tokens = _ttl_tokens(text)
+    i = 0
+    predicate = None
+    while i < len(tokens):
+        kind, m = tokens[i]
+        i += 1
+        if kind == 'punct':
+            if m.group(0) != ',':
+                # ; or . - the next term is a predicate
+                predicate = None
+                continue
+            elif predicate is None:
+                raise StreamParseException(m.group(0))
+        elif kind == 'lang' and m.group('lang') == 'prefix':
+            if i+1 >= len(tokens) or tokens[i][0] != 'pname' or tokens[i][1].group('local') \
+               or tokens[i+1][0] != 'iri':
+                raise StreamParseException(m.group(0))
+            prefix = tokens[i][1].group('prefix') or u''
+            ns = nt_unescape(tokens[i+1][1].group('iri')[1:-1])
+            namespaces[prefix] = ns
+            sink.bind(prefix, Namespace(ns))
+            i += 2
+            predicate = None
+            continue
+        elif kind == 'word' and m.group(0) == 'a':
+            predicate = RDF_TYPE
+        else:
+            # anything else after an object starts the next predicate
+            predicate = _ttl_uri(kind, m, namespaces)
+        if i >= len(tokens):
+            raise StreamParseException(m.group(0))
+        kind, m = tokens[i]
+        objectRef, i = _ttl_object(kind, m, tokens, i+1, namespaces)
+        sink.add((subject, predicate, objectRef))
+
+def _ttl_object(kind, m, tokens, i, namespaces):
+    """(term, index of the next token) for the object starting at m"""
+    if kind in ('string', 'long'):
+        quote = kind == 'long' and 3 or 1
+        lexical = nt_unescape(m.group(kind)[quote:-quote])
+        if i < len(tokens) and tokens[i][0] == 'lang':
+            return Literal(lexical, lang=tokens[i][1].group('lang')), i+1
+        elif i < len(tokens) and tokens[i][0] == 'datatype':
+            if i+1 >= len(tokens):
+                raise StreamParseException(m.group(0))
+            kind, dm = tokens[i+1]
+            return Literal(lexical, datatype=_ttl_uri(kind, dm, namespaces)), i+2
+        return Literal(lexical), i
+    elif kind == 'number':
+        lexical = m.group('number')
+        if 'e' in lexical or 'E' in lexical:
+            datatype = XSD['double']
+        elif '.' in lexical:
+            datatype = XSD['decimal']
+        else:
+            datatype = XSD['integer']
+        return Literal(lexical, datatype=datatype), i
+    elif kind == 'word' and m.group(0) in ('true', 'false'):
+        return Literal(m.group(0), datatype=XSD['boolean']), i
+    return _ttl_uri(kind, m, namespaces), i
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Graph-free RDF writers
+======================
+
+Writes N-Triples and (prefix-compressed) Turtle straight to a file-like
+object, one subject at a time, without copying the statements into an rdflib
+ConjunctiveGraph first.
+
+    w = get_writer("turtle", out, namespaces)
+    w.subject(uri, [(predicate, object), ...])
+
+Output is ASCII-safe UTF-8: anything outside printable ASCII in a term is
+written as a \\uXXXX or \\UXXXXXXXX escape, which both formats allow.
+"""
+
+import re
+
+from rdflib import URIRef, Literal, BNode
+
+from urihelper import NAMESPACES, NamespaceTrie
+
+RDF_TYPE = NAMESPACES['rdf']['type']
+
+# Formats the writers below can produce (and the aliases they answer to)
+STREAM_FORMATS = {'nt':'nt', 'ntriples':'nt', 'turtle':'turtle', 'ttl':'turtle'}
+
+# local parts that can be written as prefix:local without escaping
+QNAME_LOCAL = re.compile(r'^[A-Za-z_][A-Za-z0-9_\-]*$')
+
+_ESCAPES = {u'\\':u'\\\\', u'"':u'\\"', u'\n':u'\\n', u'\r':u'\\r', u'\t':u'\\t'}
+
+def _escape_char(c):
+    if c in _ESCAPES:
+        return _ESCAPES[c]
+    n = ord(c)
+    if n < 0x20 or n > 0x7e:
+        if n > 0xffff:
+            return u'\\U%08X' % n
+        return u'\\u%04X' % n
+    return c
+
+# characters that need more than being copied across
+_NEEDS_ESCAPE = re.compile(u'[\\\\"\x00-\x1f\x7f-\uffff]')
+
+def escape(text):
+    """Escape a string for use inside "..." or <...> in N-Triples/Turtle"""
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    if not _NEEDS_ESCAPE.search(text):
+        return text
+    chars = []
+    i = 0
+    while i < len(text):
+        c = text[i]
+        # rebuild astral characters from a narrow build's surrogate pair
+        if u'\ud800' <= c <= u'\udbff' and i+1 < len(text) and u'\udc00' <= text[i+1] <= u'\udfff':
+            n = 0x10000 + ((ord(c) - 0xd800) << 10) + (ord(text[i+1]) - 0xdc00)
+            chars.append(u'\\U%08X' % n)
+            i += 2
+            continue
+        chars.append(_escape_char(c))
+        i += 1
+    return u''.join(chars)
+
+def nt_term(term):
+    """N-Triples form of a URIRef, BNode or Literal"""
+    if isinstance(term, Literal):
+        lexical = u'"%s"' % escape(term)
+        if term.language:
+            return u'%s@%s' % (lexical, term.language)
+        elif term.datatype:
+            return u'%s^^<%s>' % (lexical, escape(term.datatype))
+        return lexical
+    elif isinstance(term, BNode):
+        return u'_:%s' % term
+    return u'<%s>' % escape(term)
+
+class NTriplesWriter(object):
+    """Writes each statement on its own line; namespaces are not used."""
+    def __init__(self, out, namespaces=None):
+        self.out = out
+
+    def subject(self, s, pairs):
+        s = nt_term(s)
+        lines = [u'%s %s %s .\n' % (s, nt_term(p), nt_term(o)) for p, o in pairs]
+        if lines:
+            self.out.write(u''.join(lines).encode('utf-8'))
+
+class TurtleWriter(object):
+    """Writes the @prefix block up front, then one paragraph per subject.
+    Consecutive statements with the same predicate share it ( p o1, o2 ),
+    so callers should hand over pairs grouped by predicate."""
+    def __init__(self, out, namespaces):
+        self.out = out
+        self.prefixes = {}
+        lines = []
+        for prefix in sorted(namespaces):
+            ns = unicode(namespaces[prefix])
+            # first prefix wins if a namespace is bound more than once
+            if prefix and ns not in self.prefixes:
+                self.prefixes[ns] = prefix
+                lines.append(u'@prefix %s: <%s> .\n' % (prefix, escape(ns)))
+        if lines:
+            lines.append(u'\n')
+            self.out.write(u''.join(lines).encode('utf-8'))
+        # only the prefixes written out above may be used
+        self.trie = NamespaceTrie(dict([(prefix, ns) for ns, prefix in self.prefixes.iteritems()]))
+
+    def predicate(self, p):
+        if p == RDF_TYPE:
+            return u'a'
+        return self.qname(p)
+
+    def term(self, term):
+        if isinstance(term, URIRef):
+            return self.qname(term)
+        elif isinstance(term, Literal) and term.datatype and not term.language:
+            return u'"%s"^^%s' % (escape(term), self.qname(term.datatype))
+        return nt_term(term)
+
+    def qname(self, uri):
+        found = self.trie.match(uri)
+        if found:
+            prefix, ns = found
+            local = uri[len(ns):]
+            if QNAME_LOCAL.match(local):
+                return u'%s:%s' % (prefix, local)
+        return nt_term(uri)
+
+    def subject(self, s, pairs):
+        chunks = []
+        last_p = None
+        for p, o in pairs:
+            if p == last_p:
+                chunks.append(u', %s' % self.term(o))
+            else:
+                if last_p is None:
+                    chunks.append(u'%s %s %s' % (self.term(s), self.predicate(p), self.term(o)))
+                else:
+                    chunks.append(u';\n    %s %s' % (self.predicate(p), self.term(o)))
+                last_p = p
+        if chunks:
+            chunks.append(u' .\n\n')
+            self.out.write(u''.join(chunks).encode('utf-8'))
+
+def get_writer(format, out, namespaces=None):
+    """Streaming writer for format, or None if it isn't one we can write
+    without rdflib's serializers."""
+    format = STREAM_FORMATS.get(format)
+    if format == 'nt':
+        return NTriplesWriter(out, namespaces)
+    elif format == 'turtle':
+        return TurtleWriter(out, namespaces or {})
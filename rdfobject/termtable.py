@@ -0,0 +1,22 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+class TermTable(object):
+    """Interns rdflib terms, so that equal URIRefs/Literals held by many
+    objects are one shared instance. rdflib terms compare unequal across
+    types, datatypes and languages, so a term is only ever swapped for one
+    that means exactly the same thing.
+
+    A table only grows, so each Manifest keeps its own and the terms go
+    when the manifest does."""
+    def __init__(self):
+        self._terms = {}
+
+    def intern(self, term):
+        return self._terms.setdefault(term, term)
+
+    def clear(self):
+        self._terms.clear()
+
+    def __len__(self):
+        return len(self._terms)
@@ -3,13 +3,17 @@
 
 import rdflib
 from rdflib import Namespace, URIRef, Literal
-from datetime import datetime
+from datetime import datetime, timedelta
+import threading
+import calendar
 import re
 
 # spot a URI/resource string (crudely, but whatever)
 URI_P = re.compile(r'^http\:|^urn\:|^info\:|^ftp\:|^https\:')
 # parse shorthand URIs like foaf:Agent into ('foaf', 'agent')
 URI_SHORT = re.compile(r'^([^:]+):([^:]+)$')
+# a URI up to and including each / or # - namespaces end on one of these
+NS_SEGMENT = re.compile(r'[^/#]*[/#]')
 
 # A few default namespaces
 NAMESPACES = {}
@@ -20,6 +24,11 @@ NAMESPACES['dcterms'] = Namespace(u'http://purl.org/dc/terms/')
 NAMESPACES['foaf'] = Namespace(u'http://xmlns.com/foaf/0.1/')
 NAMESPACES['ov'] = Namespace(u'http://open.vocab.org/terms/')
 
+# Number of resolved text -> URIRef/Literal results kept by parse_uri
+URI_CACHE_SIZE = 1024
+# Number of parsed date/dateTime literals kept by literal_datetime_to_obj
+DATETIME_CACHE_SIZE = 4096
+
 class NotANamespaceException(Exception):
     """An attempt to get a namespace was made and the URI didn't end in # or /"""
     pass
@@ -30,52 +39,396 @@ class PrefixNotKnownException(Exception):
 class URINotSetException(Exception):
     """The URI has not been set. This object cannot be serialised or otherwise transcribed with the given value."""
     pass
-    
+
+def parse_iso_datetime(text):
+    """datetime for an xsd:dateTime or xsd:date lexical form -
+    YYYY-MM-DD[Thh:mm[:ss[.ffffff]]][Z|+hh:mm|-hh:mm] - or None if text isn't
+    one. The datetimes this is compared against are naive local times, as
+    datetime.now() gives, so a time with a timezone is converted to local
+    time and handed back without one."""
+    try:
+        if text[4] != '-' or text[7] != '-':
+            return None
+        year, month, day = int(text[0:4]), int(text[5:7]), int(text[8:10])
+        hour = minute = second = microsecond = 0
+        rest = text[10:]
+        if rest and rest[0] in 'T ':
+            if rest[3] != ':':
+                return None
+            hour, minute = int(rest[1:3]), int(rest[4:6])
+            rest = rest[6:]
+            if rest.startswith(':'):
+                second = int(rest[1:3])
+                rest = rest[3:]
+            if rest.startswith('.'):
+                i = 1
+                while i < len(rest) and rest[i].isdigit():
+                    i += 1
+                microsecond = int((rest[1:i] + '000000')[:6])
+                rest = rest[i:]
+        offset = 0
+        if rest and rest != 'Z':
+            if not (rest[0] in '+-' and len(rest) == 6 and rest[3] == ':'):
+                return None
+            offset = int(rest[1:3]) * 60 + int(rest[4:6])
+            if rest[0] == '-':
+                offset = -offset
+        when = datetime(year, month, day, hour, minute, second, microsecond)
+        if not rest:
+            return when
+        utc = when - timedelta(minutes=offset)
+        try:
+            return datetime.fromtimestamp(calendar.timegm(utc.timetuple())).replace(microsecond=microsecond)
+        except (OverflowError, ValueError):
+            # outside what the platform's local time can handle
+            return utc
+    except (ValueError, IndexError):
+        return None
+
+class NamespaceTable(dict):
+    """A prefix -> Namespace dict that can't be changed once made"""
+    def _immutable(self, *args, **kw):
+        raise TypeError("NamespaceTable is read-only - use NamespaceRegistry.add/remove")
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+class NamespaceRegistry(object):
+    """The prefix -> Namespace table every URIHelper resolves against.
+
+    The table is never changed in place. add() and remove() build a changed
+    copy and publish it, together with the next generation number, as the
+    single attribute `snapshot`; only they take the lock. Readers take
+    `generation, namespaces = registry.snapshot` and need no lock, and a
+    cache built from one table only has to compare generations to know it is
+    still good."""
+    def __init__(self, namespaces=None):
+        self._lock = threading.Lock()
+        self.snapshot = (0, NamespaceTable(namespaces or {}))
+
+    @property
+    def generation(self):
+        return self.snapshot[0]
+
+    @property
+    def namespaces(self):
+        return self.snapshot[1]
+
+    def add(self, prefix, ns, replace=True):
+        """Bind prefix to ns - if replace is False, only if prefix is unbound.
+        Returns the generation the binding is in."""
+        self._lock.acquire()
+        try:
+            generation, table = self.snapshot
+            if prefix in table and (not replace or table[prefix] == ns):
+                return generation
+            changed = dict(table)
+            changed[prefix] = ns
+            self.snapshot = (generation + 1, NamespaceTable(changed))
+            return generation + 1
+        finally:
+            self._lock.release()
+
+    def remove(self, prefix):
+        self._lock.acquire()
+        try:
+            generation, table = self.snapshot
+            if prefix not in table:
+                return generation
+            changed = dict(table)
+            del changed[prefix]
+            self.snapshot = (generation + 1, NamespaceTable(changed))
+            return generation + 1
+        finally:
+            self._lock.release()
+
+class URICache(object):
+    """Bounded mapping of text to the term parse_uri resolved it to, for one
+    generation of the namespace registry. Rather than evicting entry by
+    entry, it is emptied in one go when it fills up or the generation moves
+    on. The generation and its dict are replaced together as one tuple,
+    `state`, so entries from two generations never end up mixed."""
+    def __init__(self, maxsize=URI_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.state = (None, {})
+
+    def table(self, generation):
+        """The dict of entries for generation - emptied first if it was
+        filled under another"""
+        state = self.state
+        if state[0] != generation:
+            state = self.state = (generation, {})
+        return state[1]
+
+    def get(self, key, generation):
+        d = self.table(generation)
+        value = d.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value, generation):
+        d = self.table(generation)
+        if len(d) >= self.maxsize:
+            d.clear()
+        d[key] = value
+
+    def clear(self):
+        self.state = (None, {})
+
+    def info(self):
+        return {'hits':self.hits, 'misses':self.misses,
+                'size':len(self.state[1]), 'maxsize':self.maxsize}
+
+class NamespaceTrie(object):
+    """Longest-prefix match of URIs against a set of namespaces. As a
+    namespace ends in / or #, the trie is keyed on the pieces of the URI up to
+    each of those rather than on single characters, so a lookup costs a few
+    dict lookups whatever the number of namespaces."""
+    def __init__(self, namespaces=None):
+        self.root = {}
+        if namespaces:
+            # the first prefix for a namespace wins: put named before
+            # default ('') prefixes, and otherwise go alphabetically
+            for prefix in sorted(namespaces, key=lambda p: (p == '', p)):
+                self.add(prefix, namespaces[prefix])
+
+    def add(self, prefix, ns):
+        ns = unicode(ns)
+        if not ns or ns[-1] not in '/#':
+            return
+        node = self.root
+        for segment in NS_SEGMENT.findall(ns):
+            node = node.setdefault(segment, {})
+        # None can't be a segment, so it marks the end of a namespace
+        node.setdefault(None, (prefix, ns))
+
+    def match(self, uri):
+        """(prefix, namespace) of the longest namespace uri starts with, or None"""
+        node = self.root
+        found = None
+        for segment in NS_SEGMENT.findall(uri):
+            node = node.get(segment)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
 class URIHelper:
     """ NB singleton """
 
-    class __impl:
+    class __impl(object):
         """ Implementation of the singleton interface """
         def __init__(self, namespaces):
             if not namespaces:
-                self.namespaces = {}
-                for ns in NAMESPACES:
-                    self.namespaces[ns] = NAMESPACES[ns]
-            else:
-                self.namespaces = namespaces
+                namespaces = NAMESPACES
+            self.registry = NamespaceRegistry(namespaces)
+            # parse_uri/compact caches, one set per thread, which each
+            # URIHelper handle takes from the thread it is made in
+            self._local = threading.local()
+            # (generation, NamespaceTrie) for compact()
+            self._trie = (None, None)
+            # lexical form -> datetime; datetimes never change, so one dict
+            # serves every thread
+            self.datetime_cache = {}
 
-        def add_namespace(self, prefix, ns):
-            if isinstance(ns, Namespace):
-                self.namespaces[prefix] = ns
-            else:
-                self.namespaces[prefix] = Namespace(ns)
+        @property
+        def namespaces(self):
+            """The current (read-only) prefix -> Namespace table"""
+            return self.registry.namespaces
+
+        @property
+        def generation(self):
+            """Incremented whenever the namespace table changes"""
+            return self.registry.generation
+
+        def add_namespace(self, prefix, ns, replace=True):
+            if not isinstance(ns, Namespace):
+                ns = Namespace(ns)
+            # caches notice the new generation for themselves
+            self.registry.add(prefix, ns, replace)
+
+        def del_namespace(self, prefix):
+            self.registry.remove(prefix)
+
+        def _caches(self):
+            local = self._local
+            try:
+                return local.uri_cache, local.qname_cache
+            except AttributeError:
+                local.uri_cache = URICache()
+                local.qname_cache = URICache()
+                return local.uri_cache, local.qname_cache
+
+        @property
+        def uri_cache(self):
+            return self._caches()[0]
+
+        def cache_info(self):
+            """Hit/miss counters and size of this thread's parse_uri cache"""
+            return self.uri_cache.info()
+
+        def _namespace_trie(self, generation, namespaces):
+            built_at, trie = self._trie
+            if built_at != generation:
+                trie = NamespaceTrie(namespaces)
+                # one assignment, so other threads see the old pair or the new
+                self._trie = (generation, trie)
+            return trie
+
+        def compact(self, uri, qname_cache=None):
+            """prefix:local form of uri using the longest matching namespace,
+            or uri itself (as unicode) if no namespace matches"""
+            generation, namespaces = self.registry.snapshot
+            trie = self._namespace_trie(generation, namespaces)
+            if qname_cache is None:
+                qname_cache = self._caches()[1]
+            qname = qname_cache.get(uri, generation)
+            if qname is None:
+                qname = unicode(uri)
+                found = trie.match(qname)
+                if found:
+                    prefix, ns = found
+                    qname = u"%s:%s" % (prefix, qname[len(ns):])
+                qname_cache.put(uri, qname, generation)
+            return qname
+
+        def compact_many(self, uris):
+            """compact() for each of uris, as a list. Each distinct uri is
+            only looked up once - predicates tend to repeat."""
+            trie = self._namespace_trie(*self.registry.snapshot)
+            done = {}
+            qnames = []
+            for uri in uris:
+                try:
+                    qnames.append(done[uri])
+                    continue
+                except KeyError:
+                    pass
+                qname = unicode(uri)
+                found = trie.match(qname)
+                if found:
+                    prefix, ns = found
+                    qname = u"%s:%s" % (prefix, qname[len(ns):])
+                done[uri] = qname
+                qnames.append(qname)
+            return qnames
 
         def literal_datetime_to_obj(self, lit_datetime):
-            l = lit_datetime.toPython()
-            if isinstance(l, Literal):
-                l = datetime.strptime(l.split('.')[0],"%Y-%m-%dT%H:%M:%S")
+            """datetime for a date/dateTime Literal. Literals can't carry
+            attributes, so results are cached by lexical form instead."""
+            if isinstance(lit_datetime, datetime):
+                return lit_datetime
+            text = unicode(lit_datetime)
+            try:
+                return self.datetime_cache[text]
+            except KeyError:
+                pass
+            l = parse_iso_datetime(text)
+            if l is None:
+                l = lit_datetime.toPython()
+                if isinstance(l, Literal):
+                    l = datetime.strptime(l.split('.')[0],"%Y-%m-%dT%H:%M:%S")
+            if len(self.datetime_cache) >= DATETIME_CACHE_SIZE:
+                self.datetime_cache.clear()
+            self.datetime_cache[text] = l
             return l
 
-        def parse_uri(self, rdf_text, return_Literal_not_Exception=False):
+        def parse_uri(self, rdf_text, return_Literal_not_Exception=False, uri_cache=None):
             if isinstance(rdf_text, URIRef):
                 return rdf_text
             elif isinstance(rdf_text, basestring):
-                if URI_P.match(rdf_text.strip()):
-                    return URIRef(rdf_text.strip())
-                elif URI_SHORT.match(rdf_text.strip()):
-                    prefix, tail = URI_SHORT.match(rdf_text.strip()).groups()
-                    try:
-                        return self.uriref_shorthand_uri(prefix, tail)
-                    except PrefixNotKnownException:
-                        if return_Literal_not_Exception:
-                            return Literal(rdf_text)
-                        else:
-                            raise URINotSetException
+                # only plain strings are cached - Literal subclasses carry
+                # a datatype/language that the key would lose
+                generation, namespaces = self.registry.snapshot
+                if type(rdf_text) in (unicode, str):
+                    # URICache.get/put, inlined - this is the hot path
+                    if uri_cache is None:
+                        uri_cache = self._caches()[0]
+                    state = uri_cache.state
+                    if state[0] != generation:
+                        state = uri_cache.state = (generation, {})
+                    d = state[1]
+                    term = d.get(rdf_text)
+                    if term is None:
+                        uri_cache.misses += 1
+                        term = self._parse_text(rdf_text, namespaces)
+                        if len(d) >= uri_cache.maxsize:
+                            d.clear()
+                        d[rdf_text] = term
+                    else:
+                        uri_cache.hits += 1
+                else:
+                    term = self._parse_text(rdf_text, namespaces)
+                if isinstance(term, URIRef) or return_Literal_not_Exception:
+                    return term
+                raise URINotSetException
             if return_Literal_not_Exception:
                 return Literal(rdf_text)
             else:
                 raise URINotSetException
-                    
+
+        def parse_many(self, values, literal_fallback=True):
+            """parse_uri for a whole column of values, returned as a list in
+            the same order. The namespace table is read once, each distinct
+            string is classified once, and shorthand is expanded a prefix at a
+            time. URIRefs and Literals are already terms, and are passed back
+            as they are. With literal_fallback=False, anything that isn't a
+            URIRef raises URINotSetException, as parse_uri does."""
+            generation, namespaces = self.registry.snapshot
+            values = list(values)
+            distinct = {}
+            for value in values:
+                if type(value) in (unicode, str):
+                    distinct[value] = None
+            by_prefix = {}
+            for text in distinct:
+                stripped = text.strip()
+                if URI_P.match(stripped):
+                    distinct[text] = URIRef(stripped)
+                    continue
+                m = URI_SHORT.match(stripped)
+                if m and m.group(1) in namespaces:
+                    by_prefix.setdefault(m.group(1), []).append((text, m.group(2)))
+                else:
+                    distinct[text] = Literal(text)
+            for prefix, shorthand in by_prefix.iteritems():
+                ns = unicode(namespaces[prefix])
+                for text, tail in shorthand:
+                    distinct[text] = URIRef(ns + tail)
+            terms = []
+            for value in values:
+                if type(value) in (unicode, str):
+                    term = distinct[value]
+                    if not literal_fallback and not isinstance(term, URIRef):
+                        raise URINotSetException
+                elif isinstance(value, URIRef):
+                    term = value
+                elif isinstance(value, Literal):
+                    if not literal_fallback:
+                        raise URINotSetException
+                    term = value
+                else:
+                    # datetimes, numbers and so on
+                    term = self.parse_uri(value, literal_fallback)
+                terms.append(term)
+            return terms
+
+        def _parse_text(self, rdf_text, namespaces):
+            """Uncached resolution of a string against one namespace table - a
+            URIRef, or a Literal if it cannot be read as a URI or known shorthand"""
+            text = rdf_text.strip()
+            if URI_P.match(text):
+                return URIRef(text)
+            m = URI_SHORT.match(text)
+            if m:
+                prefix, tail = m.groups()
+                if prefix in namespaces:
+                    return namespaces[prefix][tail]
+            return Literal(rdf_text)
+
         def get_uriref(self, rdf_text, force=False):
             """Similar to parse_uri, but no attempt is made to expand prefixes"""
             if isinstance(rdf_text, URIRef):
@@ -105,18 +458,40 @@ class URIHelper:
                 return self.namespaces[prefix][tail]
         
 
-    # storage for the instance reference
+    # storage for the instance reference, and a lock so that two threads
+    # can't both create it
     __instance = None
+    __lock = threading.Lock()
 
     def __init__(self, namespaces=None):
         """ Create singleton instance """
         # Check whether we already have an instance
         if URIHelper.__instance is None:
-            # Create and remember instance
-            URIHelper.__instance = URIHelper.__impl(namespaces)
+            with URIHelper.__lock:
+                if URIHelper.__instance is None:
+                    # Create and remember instance
+                    URIHelper.__instance = URIHelper.__impl(namespaces)
 
-        # Store instance reference as the only member in the handle
+        # Store instance reference in the handle, along with the caches of
+        # the thread it was made in, so they are only looked up once. The
+        # handle keeps using those caches whichever thread calls it.
         self.__dict__['_URIHelper__instance'] = URIHelper.__instance
+        self.__dict__['_URIHelper__caches'] = URIHelper.__instance._caches()
+
+    @property
+    def uri_cache(self):
+        """The parse_uri cache this handle uses"""
+        return self.__caches[0]
+
+    def cache_info(self):
+        """Hit/miss counters and size of this handle's parse_uri cache"""
+        return self.__caches[0].info()
+
+    def parse_uri(self, rdf_text, return_Literal_not_Exception=False):
+        return self.__instance.parse_uri(rdf_text, return_Literal_not_Exception, self.__caches[0])
+
+    def compact(self, uri):
+        return self.__instance.compact(uri, self.__caches[1])
 
     def __getattr__(self, attr):
         """ Delegate access to implementation """
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os, sys
+# add rdfobject to the path, if running in the test dir
+if os.path.isdir(os.path.join(os.getcwd(), 'rdfobject')):
+    sys.path.append(os.getcwd())
+else:
+    parent_dir = os.path.abspath(os.path.join(os.getcwd(), '..'))
+    if os.path.isdir(os.path.join(parent_dir, 'rdfobject')):
+        sys.path.append(parent_dir)
+    else:
+        print "Test must be run in either the test directory or the directory above it"
+        quit
+
+"""Memory used by a Manifest of part metadata, as put_stream would build it,
+held as RDFobjects (the default) and as CompactRDFobjects (compact=True).
+
+Sizes are the sum of sys.getsizeof over everything reachable from the
+Manifest, counting shared objects once; the URIHelper singleton is left out
+as both layouts share it."""
+
+from datetime import datetime
+
+from func_timer import print_timing
+
+from rdfobject import URIHelper
+from rdfobject.constructs import Manifest
+
+PARTS = 500
+VERSIONS = 3
+
+def deep_sizeof(obj, seen):
+    # iterative, as an OrderedDict's linked list is deeper than the recursion limit
+    size = 0
+    todo = [obj]
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            for k, v in obj.iteritems():
+                todo.append(k)
+                todo.append(v)
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            todo.extend(obj)
+        if hasattr(obj, '__dict__'):
+            todo.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if hasattr(obj, slot):
+                    todo.append(getattr(obj, slot))
+    return size
+
+def manifest_size(m):
+    impl = URIHelper()._URIHelper__instance
+    return deep_sizeof(m, set([id(impl), id(impl.__dict__)]))
+
+@print_timing
+def build(compact):
+    m = Manifest(compact=compact)
+    base = u"info:local/bench"
+    modified = datetime(2009, 4, 1, 12, 30)
+    for part in xrange(PARTS):
+        part_uri = u"%s/file%s.dat" % (base, part)
+        m.add_triple(part_uri, "dcterms:isPartOf", base)
+        m.add_triple(part_uri, "dcterms:modified", modified)
+        m.add_triple(part_uri, "dc:format", "application/octet-stream")
+        for version in xrange(1, VERSIONS+1):
+            version_uri = u"%s/%s" % (part_uri, version)
+            m.add_triple(part_uri, "dcterms:hasVersion", version_uri)
+            m.add_triple(version_uri, "dcterms:modified", modified)
+            m.add_triple(version_uri, "dc:format", "application/octet-stream")
+            m.add_triple(version_uri, "ov:hasChecksum", "md5:d41d8cd98f00b204e9800998ecf8427e")
+    return m
+
+print "Manifest with %s parts x %s versions (%s items)" % (PARTS, VERSIONS, PARTS * (VERSIONS+1))
+
+default_size = manifest_size(build(False))
+print "RDFobject items:        %10d bytes" % default_size
+
+compact_size = manifest_size(build(True))
+print "CompactRDFobject items: %10d bytes" % compact_size
+
+print "Compact layout uses %0.1f%% of the default" % (100.0 * compact_size / default_size)
@@ -14,6 +14,9 @@ else:
 
 from rdfobject.constructs import Manifest, ItemAlreadyExistsException, ItemDoesntExistException
 
+from StringIO import StringIO
+from rdflib import URIRef, Literal
+
 m = Manifest()
 
 RELSINT = """<?xml version="1.0" encoding="UTF-8"?>
@@ -125,7 +128,7 @@ print m.to_string(format="n3")
 print "-="*20
 
 # Manifest works like an iterator, yielding RDFobjects in the order given in 
-# its internal Manifest.items list. The list can be reordered via sort() or similar
+# its Manifest.items tuple. The items can be put in another order with reorder()
 
 for item in m:
     if item.types:
@@ -185,3 +188,85 @@ print fragment.to_string()
 print "-="*20
 print "The final, full manifest object"
 print m.to_string(format="n3")
+
+print "-="*20
+print "Journal of changes since the last checkpoint"
+m.checkpoint()
+m.add_triple(item_id2, "dc:title", "Still magic")
+m.del_triple(item_id2, "dc:format", None)
+m.add_triple(item_id2, "dc:title", "Still magic")
+for op, s, p, o in m.checkpoint():
+    print op, s, p, o
+assert m.checkpoint() == []
+
+print "-="*20
+print "Predicate and object indexes across items"
+im = Manifest(indexed=True)
+im.from_string(m.to_string())
+m.add_triple(item_id2, "dc:format", "image/png")
+im.add_triple(item_id2, "dc:format", "image/png")
+im.del_item(u"info:fedora/externalitem:1/magic.jpg")
+m.del_item(u"info:fedora/externalitem:1/magic.jpg")
+for index in (m, im):
+    print sorted(index.list_by_predicate("dc:format"))
+assert sorted(im.list_by_predicate("dc:format")) == sorted(m.list_by_predicate("dc:format"))
+assert sorted(im.list_by_object("text/xml")) == sorted(m.list_by_object("text/xml"))
+before = list(im.items)
+try:
+    im.items.reverse()
+    assert False, "items can't be reordered in place"
+except AttributeError:
+    pass
+before.reverse()
+im.reorder(before)
+assert list(im.items) == before
+
+print "-="*20
+print "get_graph is kept up to date rather than rebuilt"
+g = im.get_graph()
+im.add_triple(item_id2, "dc:title", "Back again")
+im.del_triple(u"info:fedora/uuid:23e0e1ca-2284-11de-9609-000e2ed68b2b/aggregation", "dc:format", None)
+im.checkpoint()
+assert im.get_graph() is g
+assert set(g.triples((None, None, None))) == set(im.triples((None, None, None)))
+# reloading an item in place goes through the manifest's journal too
+reloaded = im.get_item(item_id2)
+reloaded.from_string(item_id2, u"""<%s> <http://purl.org/dc/elements/1.1/title> "Reloaded" .\n""" % item_id2, format="nt", streaming=True)
+assert reloaded.journal is im.journal and reloaded.namespaces is im.namespaces
+assert set(im.get_graph().triples((None, None, None))) == set(im.triples((None, None, None)))
+assert im.list_objects(item_id2, "dc:title") == [Literal(u"Reloaded")]
+assert [s for s, o in im.list_by_predicate("dc:title") if s == URIRef(item_id2)] == [URIRef(item_id2)]
+
+print "-="*20
+print "Streaming from_string fills the items as it reads"
+out = StringIO()
+im.to_stream(out, "nt")
+for format, text in (("xml", im.to_string()), ("nt", out.getvalue())):
+    sm = Manifest()
+    sm.from_string(text, format=format, streaming=True)
+    assert sm.digest() == im.digest(), "%s streaming load differs" % format
+    assert not sm.journal, "what was read in is the checkpoint"
+    print "%s: %s items" % (format, len(sm.items))
+sm.add_triple(u"info:local/before", "dc:title", "Made before the load")
+sm.from_string(out.getvalue(), format="nt", streaming=True)
+assert [(op, unicode(s)) for op, s, p, o in sm.checkpoint()] == [('add', u"info:local/before")]
+
+print "-="*20
+print "Items share the manifest's namespace table"
+item = sm.get_item(sm.items[0])
+sm.add_namespace(u"shared", u"http://example.org/shared#")
+assert item.namespaces is sm.namespaces and unicode(item.namespaces[u"shared"]) == u"http://example.org/shared#"
+assert u"shared" in item.get_bindings()
+copy = item.clone(u"info:local/copy")
+copy.add_namespace(u"mine", u"http://example.org/mine#")
+copy.del_namespace(u"shared")
+assert u"mine" not in sm.namespaces and u"shared" in sm.namespaces
+assert u"mine" in copy.namespaces and u"shared" not in copy.namespaces
+
+print "-="*20
+print "Compact manifests intern terms in their own table"
+cm1 = Manifest(compact=True)
+cm2 = Manifest(compact=True)
+cm1.add_triple(item_id2, "dc:title", "Interned")
+assert cm1.get_item(item_id2).terms is cm1.terms
+assert len(cm1.terms) and not len(cm2.terms)
@@ -82,3 +82,26 @@ for uri in o.list_assertion_groups():
     else:
         print "Was NOT current 2 days ago\n"
 
+
+print "Valid now: %s" % o.list_valid_assertion_groups()
+print "Valid over the last 3 days: %s" % o.list_valid_assertion_groups(datetime.now()-timedelta(days=3), datetime.now())
+assert len(o.list_valid_assertion_groups(datetime.now()-timedelta(days=3), datetime.now())) == 2
+for uri in o.list_assertion_groups():
+    assert (uri in o.list_valid_assertion_groups()) == bool(o.is_assertion_group_valid(uri))
+o.revert()
+assert len(o.list_valid_assertion_groups(datetime.now()-timedelta(days=3), datetime.now())) == 2
+
+print "Validity set through the entity is seen too"
+group = o.list_valid_assertion_groups()[0]
+entity.del_triple(group, "ov:validUntil")
+o.add_triple(group, "ov:validUntil", datetime.now()-timedelta(hours=1))
+assert not o.is_assertion_group_valid(group)
+assert group not in o.list_valid_assertion_groups()
+o.commit()
+assert not o.is_assertion_group_valid(group)
+later = entity.add_named_graph("third", datetime.now()-timedelta(days=1))
+assert o.is_assertion_group_valid(later.uri)
+index = o._validity_index()
+entity.add_triple(later.uri, "dc:title", "Not about validity")
+o.commit()
+assert o._validity_index() is index, "an unrelated change shouldn't rebuild the index"
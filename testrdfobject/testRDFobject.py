@@ -14,6 +14,7 @@ else:
         quit
 
 from rdfobject import *
+from rdflib import URIRef, Literal
 
 print "+@"*30
 print "Build + serialise Test"
@@ -45,6 +46,16 @@ print "wildcard object delete Test"
 r.del_triple(u'dc:description')
 r.add_triple(u'dc:description', u'Better Description')
 
+# Only None is a wildcard - an empty literal is deleted like any other value
+r.add_triple(u'dc:subject', u'')
+r.add_triple(u'dc:subject', u'Theses')
+r.del_triple(u'dc:subject', u'')
+assert r.list_objects(u'dc:subject') == [Literal(u'Theses')]
+r.add_triple(u'dc:subject', u'')
+r.del_triples([(u'dc:subject', u'')])
+assert r.list_objects(u'dc:subject') == [Literal(u'Theses')]
+r.del_triple(u'dc:subject')
+
 print r.to_string(format='n3')
 
 print "+@"*30
@@ -72,6 +83,105 @@ r.from_string(u"info:fedora/ora:1", text, encoding='utf-8')
 
 print r.to_string(format='n3')
 
+print "+@"*30
+print "Clone Test"
+
+c = r.clone(u"info:fedora/ora:2")
+c.add_triple(u'dc:title', u'A clone')
+print c.to_string(format='n3')
+assert len(c.triples) == len(r.triples) + 1 and r.uri == URIRef(u"info:fedora/ora:1")
+
+print "+@"*30
+print "URI compaction Test"
+
+print r.urihelper.compact_many([p for p, o in r.list_statements()])
+assert r.urihelper.compact(u"http://purl.org/dc/terms/creator") == u"dcterms:creator"
+assert r.urihelper.compact(u"urn:nothing:known") == u"urn:nothing:known"
+
+print "+@"*30
+print "Bulk URI parsing Test"
+
+column = [u"dc:title", u"http://example.org/a", u"Plain text", u"dc:title"]
+print r.urihelper.parse_many(column)
+assert r.urihelper.parse_many(column) == [r.urihelper.parse_uri(v, True) for v in column]
+
+print "+@"*30
+print "to_string cache Test"
+
+first = r.to_string()
+assert r.to_string() is first, "unchanged object should reuse its serialisation"
+r.add_triple(u'dc:subject', u'Caching')
+changed = r.to_string()
+assert changed is not first and 'Caching' in changed
+r.del_triple(u'dc:subject', u'Caching')
+assert 'Caching' not in r.to_string()
+unbound = r.to_string()
+r.add_namespace(u'sioc', u"http://rdfs.org/sioc/ns#")
+assert r.to_string() is not unbound
+
+print "+@"*30
+print "parse_uri cache Test"
+
+uh = r.urihelper
+before = uh.cache_info()
+uh.parse_uri(u"dc:cachetest")
+uh.parse_uri(u"dc:cachetest")
+after = uh.cache_info()
+print after
+assert after['misses'] == before['misses'] + 1 and after['hits'] == before['hits'] + 1
+# a namespace change must not leave old resolutions behind
+assert uh.parse_uri(u"cachens:x", True) == Literal(u"cachens:x")
+uh.add_namespace(u"cachens", u"http://example.org/cachens#")
+assert uh.parse_uri(u"cachens:x") == URIRef(u"http://example.org/cachens#x")
+# each thread has its own cache, but all of them share one namespace table
+import threading
+seen = {}
+def in_thread():
+    helper = URIHelper()
+    seen['cache'] = helper.uri_cache
+    seen['uri'] = helper.parse_uri(u"cachens:x")
+    seen['info'] = helper.cache_info()
+    # a handle from another thread keeps to the caches it was made with
+    seen['before'] = uh.cache_info()['misses']
+    uh.parse_uri(u"cachens:from_a_worker")
+    seen['after'] = uh.cache_info()['misses']
+    helper.add_namespace(u"threadns", u"http://example.org/threadns#")
+worker = threading.Thread(target=in_thread)
+worker.start()
+worker.join()
+assert seen['cache'] is not uh.uri_cache and seen['info']['misses'] == 1
+assert seen['after'] == seen['before'] + 1
+assert seen['uri'] == URIRef(u"http://example.org/cachens#x")
+assert uh.parse_uri(u"threadns:x") == URIRef(u"http://example.org/threadns#x")
+
+print "+@"*30
+print "date/dateTime parse Test"
+
+import time
+from datetime import datetime
+from rdfobject.urihelper import parse_iso_datetime
+# timezoned values come back in local time, to compare with naive ones -
+# here New York, four hours behind UTC in April
+tz = os.environ.get('TZ')
+os.environ['TZ'] = 'America/New_York'
+time.tzset()
+assert parse_iso_datetime(u"2009-04-01") == datetime(2009, 4, 1)
+assert parse_iso_datetime(u"2009-04-01T12:30:00") == datetime(2009, 4, 1, 12, 30)
+assert parse_iso_datetime(u"2009-04-01T12:30:00Z") == datetime(2009, 4, 1, 8, 30)
+assert parse_iso_datetime(u"2009-04-01T12:30:00+01:30") == datetime(2009, 4, 1, 7, 0)
+assert parse_iso_datetime(u"2009-04-01T23:30:00-01:00") == datetime(2009, 4, 1, 20, 30)
+assert parse_iso_datetime(u"2009-04-01T12:30:00.25") == datetime(2009, 4, 1, 12, 30, 0, 250000)
+assert parse_iso_datetime(u"2009-04-01T12:30:00.123456789Z") == datetime(2009, 4, 1, 8, 30, 0, 123456)
+assert parse_iso_datetime(u"2009-04-01T12:30:00 GMT") is None
+# a naive literal is local, so 09:00 in New York is after 12:30 UTC
+assert parse_iso_datetime(u"2009-04-01T12:30:00Z") < parse_iso_datetime(u"2009-04-01T09:00:00")
+assert parse_iso_datetime(u"2009-04-01T13:00:00Z") == parse_iso_datetime(u"2009-04-01T09:00:00")
+if tz is None:
+    del os.environ['TZ']
+else:
+    os.environ['TZ'] = tz
+time.tzset()
+
 print "+@"*30
 print "Remote URI PARSE Test"
 
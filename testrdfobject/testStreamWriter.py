@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os, sys
+# add rdfobject to the path, if running in the test dir
+if os.path.isdir(os.path.join(os.getcwd(), 'rdfobject')):
+    sys.path.append(os.getcwd())
+else:
+    parent_dir = os.path.abspath(os.path.join(os.getcwd(), '..'))
+    if os.path.isdir(os.path.join(parent_dir, 'rdfobject')):
+        sys.path.append(parent_dir)
+    else:
+        print "Test must be run in either the test directory or the directory above it"
+        quit
+
+from StringIO import StringIO
+
+from rdfobject import RDFobject, TextInputSource, N3NotUnderstoodException
+from rdfobject.constructs import Manifest
+from rdfobject.stores import FileStorageFactory
+
+from rdflib import ConjunctiveGraph, Literal
+
+from datetime import datetime
+
+def as_set(g):
+    return set(g.triples((None, None, None)))
+
+r = RDFobject(u"info:fedora/ora:1")
+r.add_namespace(u'foaf', u"http://xmlns.com/foaf/0.1/")
+r.add_namespace(u'dc', u"http://purl.org/dc/elements/1.1/")
+r.add_type(u'foaf:Agent')
+r.add_triple(u'dc:title', u'Thèsis, with "quotes"\nand a newline')
+r.add_triple(u'dc:description', u'An okay Description')
+r.add_triple(u'dc:description', Literal(u'Une description', lang='fr'))
+r.add_triple(u'dcterms:created', datetime(2009, 4, 1, 12, 30))
+r.add_triple(u'dcterms:creator', u'http://registry.ouls.ox.ac.uk/p:10230')
+
+for format, parser in [('nt', 'nt'), ('turtle', 'n3')]:
+    print "+@"*30
+    print "Streaming %s" % format
+    out = StringIO()
+    r.to_stream(out, format)
+    print out.getvalue()
+    g = ConjunctiveGraph()
+    g.parse(TextInputSource(out.getvalue()), format=parser)
+    assert as_set(g) == as_set(r.get_graph()), "%s round trip lost or gained triples" % format
+    print "Round trip through rdflib's %s parser matches get_graph()" % parser
+
+print "+@"*30
+print "Manifest as turtle"
+
+m = Manifest()
+m.add_triple(u"info:fedora/ora:1/ROOT", "dc:format", "application/rdf+xml")
+m.add_triple(u"info:fedora/ora:1/image.jpg", "dc:format", "image/jpeg")
+m.add_triple(u"info:fedora/ora:1/image.jpg", "dcterms:isPartOf", "info:fedora/ora:1")
+out = StringIO()
+m.to_stream(out, "turtle")
+print out.getvalue()
+assert not m.altered
+
+print "+@"*30
+print "N-Triples backed filestore"
+
+store = FileStorageFactory().get_store(u'info:local/', u'ntstore', rdf_format='nt')
+obj = store.getObject("test")
+root = obj.getRoot()
+root.add_triple('dcterms:references', 'http://ora.ouls.ox.ac.uk')
+root.add_triple('dc:title', u'Stored as N-Triples')
+obj.putRoot(root)
+obj.putManifest(m)
+
+print store.storeclient.get_stream("test", "ROOT", "ROOT_1")
+assert obj.getRoot().triples == root.triples
+assert as_set(obj.getManifest().get_graph()) == as_set(m.get_graph())
+print "ROOT and MANIFEST read back unchanged"
+
+print "+@"*30
+print "Streaming parse, keeping only one subject"
+
+out = StringIO()
+r.to_stream(out, "nt")
+nt = out.getvalue() + '<info:fedora/ora:2> <http://purl.org/dc/elements/1.1/title> "Someone else" .\n'
+for format, text in [('nt', nt), ('xml', r.to_string())]:
+    p = RDFobject()
+    p.from_string(u"info:fedora/ora:1", text, format=format, streaming=True)
+    assert p.triples == r.triples and p.types == r.types, "%s streaming parse differs" % format
+    print "%s: %s triples read" % (format, len(p.triples) + len(p.types))
+
+print "+@"*30
+print "A block of Turtle statements in one go"
+
+t = RDFobject(u"info:fedora/ora:1")
+t.add_namespace(u'dc', u"http://purl.org/dc/elements/1.1/")
+t.add_n3_triples(u'''@prefix foaf: <http://xmlns.com/foaf/0.1/> .
+a foaf:Agent ;
+    dc:title "Th\\u00e8sis, with \\"quotes\\"\\nand a newline" ;
+    dc:description "An okay Description", "Une description"@fr ;
+    dcterms:created "2009-04-01T12:30:00"^^<http://www.w3.org/2001/XMLSchema#dateTime>
+    dcterms:creator http://registry.ouls.ox.ac.uk/p:10230 .
+''')
+assert t.triples == r.triples and t.types == r.types, "Turtle block differs"
+try:
+    t.add_n3_triple(u'dcx:title "Magic"')
+    assert False, "an unknown prefix should not be taken as a URI"
+except N3NotUnderstoodException:
+    pass
+print "%s triples read" % (len(t.triples) + len(t.types))
@@ -13,6 +13,7 @@ else:
         quit                                
 
 from rdfobject import FileEntityFactory, NAMESPACES
+from rdflib import Literal
 
 f = FileEntityFactory(uri_base=u"info:fedora/", storage_dir="fileentitytest", prefix="_")
 
@@ -72,3 +73,49 @@ entity.commit()
 entity.commit()
 
 
+
+print "-=-"*20
+print "Reloading - ROOT and MANIFEST are only parsed when needed"
+reloaded = f.get(uri)
+print reloaded.list_parts()
+assert not reloaded.root.loaded and not reloaded.manifest.loaded
+assert reloaded.root.to_string() == reloaded.root.raw
+assert reloaded.root.triples == entity.root.triples
+assert reloaded.root.loaded
+
+print "Putting back what was there isn't a change - no new ROOT version"
+versions = reloaded.obj.list_part_versions('ROOT')
+reloaded.add_triple(uri, "dc:subject", "passing through")
+reloaded.del_triple(uri, "dc:subject", "passing through")
+reloaded.commit()
+assert reloaded.obj.list_part_versions('ROOT') == versions
+
+print "-=-"*20
+print "Pattern queries over root and manifest, without a graph"
+print entity.list_aggregates()
+assert entity.list_aggregates() == [t.uri]
+creators = entity.triples((None, "dc:creator", None))
+print creators.next()
+assert set(entity.triples((None, "dc:creator", None))) == \
+       set([(s, p, o) for s, p, o in entity.get_graph().triples((None, NAMESPACES['dc']['creator'], None))])
+
+print "-=-"*20
+print "get_graph is a view over the root and manifest graphs"
+g = entity.get_graph()
+assert len(g) == len(entity.root.get_graph()) + len(entity.manifest.get_graph())
+print entity.to_string()
+
+print "-=-"*20
+print "Named graphs read back in start with an empty journal"
+reparsed = f.get(uri)
+reparsed.manifest.load()
+assert reparsed.parts_objs[t.uri].list_objects(uri, "foaf:name") == [Literal(u"Ben O'Steen")]
+assert not reparsed.parts_objs[t.uri].journal
+
+print "Named graphs can be fetched straight after a reload"
+reopened = f.get(uri)
+versions = reopened.obj.list_part_versions('test')
+assert not reopened.manifest.loaded
+assert reopened.get_named_graph("test").list_objects(uri, "foaf:name") == [Literal(u"Ben O'Steen")]
+assert reopened.add_named_graph("test") is reopened.get_named_graph("test")
+assert reopened.obj.list_part_versions('test') == versions
@@ -70,6 +70,13 @@ print "Parts: %s" % vid.list_parts()
 print "Deleteme Parts: %s" % vid.list_part_versions('deleteme')
 
 print "Versions of ROOT: %s" % vid.list_part_versions('ROOT')
+
+print "Aggregates, a page at a time: %s" % loaded_vid.list_aggregates(limit=1)
+assert loaded_vid.count_aggregates() == 2
+assert loaded_vid.list_aggregates(offset=1) == loaded_vid.list_aggregates()[1:]
+assert loaded_vid.list_parts_of() == loaded_vid.list_aggregates()
+print "Versions of foobar: %s" % loaded_vid.list_versions("%s/foobar" % loaded_vid.uri)
+assert loaded_vid.count_versions("%s/foobar" % loaded_vid.uri) == 2
 try:
     bar = f.clone_store('foo', 'barbar')
 except StoreAlreadyExistsException:
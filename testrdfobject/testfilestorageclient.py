@@ -13,6 +13,7 @@ else:
         quit                                
 
 from rdfobject.stores import FileStorageFactory
+from rdfobject.constructs import Manifest
 
 factory_f = FileStorageFactory()
 store = factory_f.get_store(u'info:local/', u'localstore')
@@ -152,3 +153,46 @@ obj.putManifest(m)
 rdf_obj = obj.getRoot()
 print rdf_obj.to_string()
 
+
+print "==="*20
+print "Sharded manifest - only the changed shard is rewritten"
+
+sharded = factory_f.get_store(u'info:local/', u'shardedstore', rdf_format='nt', manifest_shards=8)
+sobj = sharded.getObject("test")
+sm = Manifest()
+for n in xrange(20):
+    sm.add_triple(u"info:local/test/file%s.dat" % n, "dc:format", "text/plain")
+sobj.putManifest(sm)
+stored = dict(sharded._shard_index("test", "MANIFEST")['shards'])
+sm.add_triple(u"info:local/test/file3.dat", "dc:format", "text/csv")
+sobj.putManifest(sm)
+changed = [b for b, v in sharded._shard_index("test", "MANIFEST")['shards'].items() if v != stored[b]]
+print "%s shards, changed: %s" % (len(stored), changed)
+assert changed == [sharded._shard_of("test", u"info:local/test/file3.dat")]
+assert sobj.getManifest().digest() == sm.digest()
+
+print "An emptied shard that fills again gets a new version, not its first one"
+bucket = changed[0]
+in_bucket = [uri for uri in sm.items if sharded._shard_of("test", uri) == bucket]
+for uri in in_bucket:
+    sm.del_item(uri)
+sobj.putManifest(sm)
+assert bucket not in sharded._shard_index("test", "MANIFEST")['shards']
+for uri in in_bucket:
+    sm.add_triple(uri, "dc:format", "text/html")
+sobj.putManifest(sm)
+assert sharded._shard_index("test", "MANIFEST")['shards'][bucket][0] == 3
+assert sharded.getObject("test").getManifest().digest() == sm.digest()
+assert "MANIFEST.shards" not in sobj.list_parts()
+
+print "Reopening a sharded store in another format rewrites every shard"
+xml_store = factory_f.get_store(u'info:local/', u'reformatstore', rdf_format='xml', manifest_shards=4)
+xml_obj = xml_store.getObject("test")
+rm = Manifest()
+for n in xrange(8):
+    rm.add_triple(u"info:local/test/file%s.dat" % n, "dc:format", "text/plain")
+xml_obj.putManifest(rm)
+rm.add_triple(u"info:local/test/file3.dat", "dc:format", "text/csv")
+nt_store = factory_f.get_store(u'info:local/', u'reformatstore', rdf_format='nt', manifest_shards=4)
+nt_store.getObject("test").putManifest(rm)
+assert nt_store.getObject("test").getManifest().digest() == rm.digest()